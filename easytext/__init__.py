@@ -2,6 +2,9 @@
 
 from .easytext import *
 from .algorithms import *
+from .parsecache import ParseCache
+from .tokencorpus import TokenCorpus
+from .knn import VectorIndex
 
 
 
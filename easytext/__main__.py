@@ -2,7 +2,7 @@
 from glob import glob
 from argparse import ArgumentParser
 
-from .fileio import read_input_files
+from .fileio import DocStream
 
 # store all subcommands
 from .subcommand_functions import *
@@ -42,13 +42,10 @@ if __name__ == '__main__':
     parser = make_parser(all_subcommands)
     args = parser.parse_args()
     
-    # get parsed documents
-    texts, docnames = read_input_files(args.infiles, args.doclabelcol, args.textcol)
-    
-    # check doclabelcols and texts
-    assert(len(docnames) > 0 and len(docnames) == len(texts))
-    assert(isinstance(texts[0],str) and isinstance(docnames[0],str))
-    print(len(texts), 'texts identified.')
+    # stream of documents read lazily from input files. docnames is 
+    #   filled in as the subcommand reads through texts.
+    texts = DocStream(args.infiles, args.doclabelcol, args.textcol)
+    docnames = texts.docnames
     
     
     # COMMAND FUNCTIONALITY MOSTLY IN subcommand_functions file
@@ -59,6 +56,7 @@ if __name__ == '__main__':
         
     # envoke the appropriate subcommand functions
     final_fname = all_subcommands[args.command]['command'](texts, docnames, args)
+    print(len(docnames), 'texts were processed.')
     print('saved', args.command, 'result as', final_fname)
 
 
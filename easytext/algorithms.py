@@ -1,16 +1,45 @@
-from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer, TfidfTransformer, HashingVectorizer
+from sklearn.pipeline import make_pipeline
 from sklearn.decomposition import NMF, LatentDirichletAllocation
 import numpy as np
 from collections import Counter
-from glove import Glove, Corpus
+import pandas as pd
+import scipy.sparse
+import os
+import pickle
+import hashlib
+import itertools
+import multiprocessing
+from glove import Glove
 
-from .glovetools import glove_transform_paragraph, glove_projection, supervised_vectors
-from .docmodel import DocModel
+from .glovetools import supervised_vectors, cooccurrence_matrix, CooccurrenceBuilder, dimension_words, paragraph_vectors, tfidf_mean_vectors
+from .docmodel import DocModel, token_list
+from .tokencorpus import TokenCorpus, vocab_count_matrix
+from .easytext import chunk_iter
+from .reports import top_k_indices
 
 
 def passthrough(x):
     return x
 
+def count_vectorize(docbows, min_tf=2):
+    '''
+        Creates sparse document-term matrix of counts.
+        Output: (counts, vocab, vectorizer) tuple, where vectorizer is a 
+            CountVectorizer that will reproduce counts on new documents.
+        Inputs:
+            docbows: Iterable of document token iterables or TokenCorpus.
+            min_tf: Minimum number of documents a token must appear in.
+    '''
+    if isinstance(docbows, TokenCorpus):
+        counts, vocab = docbows.doc_term_matrix(min_df=min_tf, sort_vocab=True)
+        vectorizer = CountVectorizer(tokenizer=passthrough, preprocessor=passthrough, vocabulary=vocab)
+    else:
+        vectorizer = CountVectorizer(tokenizer=passthrough, preprocessor=passthrough, min_df=min_tf)
+        counts = vectorizer.fit_transform(docbows)
+        vocab = vectorizer.get_feature_names()
+    return counts, vocab, vectorizer
+
 
 def lda(docbows, n_topics, random_state=0, min_tf=2, learning_method='online', docnames=None, include_model=False,  **kwargs):
     '''
@@ -20,7 +49,7 @@ def lda(docbows, n_topics, random_state=0, min_tf=2, learning_method='online', d
         Output: Returns DocModel object containing the results of the topic model.
         
         Inputs: 
-            docbows: Iterable of document token iterables
+            docbows: Iterable of document token iterables or TokenCorpus.
             n_topics: Number of documents to use in the topic model.
             random_state: Integer for seeding random generator. Allows
                 for making reproducable topic models.
@@ -34,9 +63,7 @@ def lda(docbows, n_topics, random_state=0, min_tf=2, learning_method='online', d
                 sklearn LatentDirichletAllocation function.
     '''
     
-    vectorizer = CountVectorizer(tokenizer = lambda x: x, preprocessor=lambda x:x,min_df=min_tf)
-    corpus = vectorizer.fit_transform(docbows)
-    vocab = vectorizer.get_feature_names()
+    corpus, vocab, vectorizer = count_vectorize(docbows, min_tf)
     
     lda_model = LatentDirichletAllocation(
         n_components=n_topics, 
@@ -53,9 +80,174 @@ def lda(docbows, n_topics, random_state=0, min_tf=2, learning_method='online', d
     topics = topics/topics.sum(axis=1)[:, np.newaxis]
     
     if include_model:
-        return DocModel(doctopics, topics, vocab, docnames=docnames, model=lda_model, vectorizer=vectorizer)
+        return DocModel(doctopics, topics, docnames=docnames, basisnames=vocab, model=lda_model, vectorizer=vectorizer)
+    else:
+        return DocModel(doctopics, topics, docnames=docnames, basisnames=vocab)
+    
+def build_vocab(docbows, min_tf=2):
+    '''
+        Single pass over docbows to find words that appear in at least 
+            min_tf documents (as min_df in sklearn CountVectorizer).
+        Output: (sorted vocab list, number of documents) tuple.
+    '''
+    docfreq = Counter()
+    n_docs = 0
+    for doc in docbows:
+        docfreq.update(set(doc.types) if hasattr(doc, 'types') else set(doc))
+        n_docs += 1
+    vocab = sorted(w for w,df in docfreq.items() if df >= min_tf)
+    return vocab, n_docs
+
+def save_checkpoint(fname, state):
+    '''
+        Pickles state to fname, writing to a temporary file first so an
+            interrupted write doesn't corrupt the last checkpoint.
+    '''
+    tmpfname = fname + '.tmp'
+    with open(tmpfname, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpfname, fname)
+
+def names_digest(names):
+    '''
+        Short hash of a list of (document) names, used to check that a
+            checkpoint belongs to the same corpus.
+    '''
+    if names is None:
+        return None
+    h = hashlib.sha1()
+    for name in names:
+        h.update(str(name).encode('utf-8', errors='replace'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def online_lda(docbows, n_topics, random_state=0, min_tf=2, batch_size=1000, n_epochs=1, n_features=None, total_samples=None, checkpoint=None, checkpoint_every=None, docnames=None, include_model=False, verbose=True, **kwargs):
+    '''
+        Out-of-core version of lda() that trains sklearn 
+            LatentDirichletAllocation with partial_fit() on mini-batches 
+            of documents, so neither the bows nor the full document-term
+            matrix need to fit in memory.
+            
+        Output: Returns DocModel object containing the results of the topic model.
+        
+        Inputs: 
+            docbows: Re-iterable of document token iterables or DocTokens 
+                (i.e. the wordlist output of easyparse). It is iterated
+                once to build the vocabulary, n_epochs times for training,
+                and once more to compute document topics, so consider 
+                using a ParseCache when it parses texts on each pass.
+            n_topics: Number of documents to use in the topic model.
+            random_state: Integer for seeding random generator.
+            min_tf: Minimum number of documents a token must appear in
+                to be added to the topic model (same as lda()).
+            batch_size: Number of documents per partial_fit() call.
+            n_epochs: Number of training passes over docbows.
+            n_features: If provided, tokens are hashed into n_features
+                columns using sklearn HashingVectorizer instead of 
+                building a vocabulary (saves the first pass, but basis
+                names are hash buckets and min_tf is not applied).
+            total_samples: Number of documents in the corpus, used to 
+                scale online updates. Counted in the vocabulary pass, 
+                or len(docbows) (if available) when hashing.
+            checkpoint: File where the model is saved every 
+                checkpoint_every batches. If the file exists, training
+                resumes from it, and an exception is raised if it was 
+                made with different n_topics, n_features, min_tf, 
+                batch_size, random_state, total_samples or docnames.
+            checkpoint_every: Number of batches between checkpoints.
+            docnames: document names that will appear in DocModel
+                for convenience.
+            **kwargs: other keyword arguments fed directly into the 
+                sklearn LatentDirichletAllocation function.
+    '''
+    
+    # settings that must match to resume from a checkpoint
+    config = dict(
+        n_topics=n_topics, 
+        n_features=n_features, 
+        min_tf=min_tf if n_features is None else None, 
+        batch_size=batch_size, 
+        random_state=random_state, 
+        total_samples=total_samples, 
+        docnames=names_digest(docnames),
+    )
+    
+    if checkpoint is not None and os.path.isfile(checkpoint):
+        with open(checkpoint, 'rb') as f:
+            state = pickle.load(f)
+        
+        saved = state.get('config', dict())
+        diff = sorted(k for k in config if saved.get(k) != config[k])
+        if len(diff) > 0:
+            raise Exception('Checkpoint {} was made with different settings ({}). Delete it or '
+                'use another checkpoint file.'.format(checkpoint, ', '.join(diff)))
+        if state['epoch'] > n_epochs:
+            raise Exception('Checkpoint {} was trained for {} epochs, more than n_epochs={}.'.format(
+                checkpoint, state['epoch'], n_epochs))
+        
+        if verbose and state['epoch'] == n_epochs:
+            print('checkpoint', checkpoint, 'finished training, only computing document topics')
+        elif verbose: 
+            print('resuming from checkpoint', checkpoint, 'at epoch', state['epoch'], 'batch', state['batch'])
+    
+    else:
+        if n_features is not None:
+            vectorizer = HashingVectorizer(tokenizer=passthrough, preprocessor=passthrough, n_features=n_features, alternate_sign=False, norm=None)
+            vocab = None
+            if total_samples is None:
+                total_samples = len(docbows) if hasattr(docbows, '__len__') else 1e6
+        else:
+            vocab, n_docs = build_vocab(docbows, min_tf)
+            vectorizer = CountVectorizer(tokenizer=passthrough, preprocessor=passthrough, vocabulary=vocab)
+            if total_samples is None:
+                total_samples = n_docs
+            if verbose: print('built vocabulary of', len(vocab), 'words from', n_docs, 'documents')
+        
+        lda_model = LatentDirichletAllocation(
+            n_components=n_topics, 
+            learning_method='online',
+            batch_size=batch_size,
+            total_samples=total_samples,
+            random_state=random_state, 
+            **kwargs,
+           )
+        state = dict(model=lda_model, vectorizer=vectorizer, vocab=vocab, config=config, epoch=0, batch=0)
+    
+    lda_model, vectorizer, vocab = state['model'], state['vectorizer'], state['vocab']
+    colmap = {w:i for i,w in enumerate(vocab)} if vocab is not None else None
+    
+    def vectorize(batch):
+        if colmap is not None:
+            return vocab_count_matrix(batch, colmap)
+        return vectorizer.transform([token_list(doc) for doc in batch])
+    
+    # train on mini-batches
+    while state['epoch'] < n_epochs:
+        # skip documents of batches trained on before the checkpoint
+        docs = itertools.islice(docbows, state['batch']*batch_size, None)
+        for i, batch in enumerate(chunk_iter(docs, batch_size), state['batch']):
+            lda_model.partial_fit(vectorize(batch))
+            state['batch'] = i + 1
+            
+            if checkpoint is not None and checkpoint_every and state['batch'] % checkpoint_every == 0:
+                save_checkpoint(checkpoint, state)
+                if verbose: print('saved checkpoint after epoch', state['epoch'], 'batch', state['batch'])
+        
+        state['epoch'] += 1
+        state['batch'] = 0
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, state)
+    
+    # compute document topics in a final pass
+    doctopics = np.vstack([lda_model.transform(vectorize(batch)) for batch in chunk_iter(docbows, batch_size)])
+    topics = lda_model.components_
+    topics = topics/topics.sum(axis=1)[:, np.newaxis]
+    basisnames = vocab if vocab is not None else list(range(topics.shape[1]))
+    
+    if include_model:
+        return DocModel(doctopics, topics, docnames=docnames, basisnames=basisnames, model=lda_model, vectorizer=vectorizer)
     else:
-        return DocModel(doctopics, topics, vocab, docnames=docnames)
+        return DocModel(doctopics, topics, docnames=docnames, basisnames=basisnames)
     
 def nmf(docbows, n_topics, random_state=0, min_tf=2, docnames=None, include_model=False,  **kwargs):
     '''
@@ -65,7 +257,7 @@ def nmf(docbows, n_topics, random_state=0, min_tf=2, docnames=None, include_mode
         Output: Returns DocModel object containing the results of the topic model.
         
         Inputs: 
-            docbows: Iterable of document token iterables
+            docbows: Iterable of document token iterables or TokenCorpus.
             n_topics: Number of documents to use in the topic model.
             random_state: Integer for seeding random generator. Allows
                 for making reproducable topic models.
@@ -77,9 +269,15 @@ def nmf(docbows, n_topics, random_state=0, min_tf=2, docnames=None, include_mode
                 sklearn NMF function.
     '''
 
-    vectorizer = TfidfVectorizer(tokenizer = passthrough, preprocessor=passthrough,min_df=min_tf)
-    corpus = vectorizer.fit_transform(docbows)
-    vocab = vectorizer.get_feature_names()
+    if isinstance(docbows, TokenCorpus):
+        counts, vocab = docbows.doc_term_matrix(min_df=min_tf, sort_vocab=True)
+        tfidf = TfidfTransformer().fit(counts)
+        corpus = tfidf.transform(counts)
+        vectorizer = make_pipeline(CountVectorizer(tokenizer=passthrough, preprocessor=passthrough, vocabulary=vocab), tfidf)
+    else:
+        vectorizer = TfidfVectorizer(tokenizer = passthrough, preprocessor=passthrough,min_df=min_tf)
+        corpus = vectorizer.fit_transform(docbows)
+        vocab = vectorizer.get_feature_names()
     
     nmf_model = NMF(
         n_components=n_topics, 
@@ -91,14 +289,136 @@ def nmf(docbows, n_topics, random_state=0, min_tf=2, docnames=None, include_mode
     topics = nmf_model.components_
     
     if include_model:
-        return DocModel(doctopics, topics, vocab, docnames=docnames, model=nmf_model, vectorizer=vectorizer)
+        return DocModel(doctopics, topics, docnames=docnames, basisnames=vocab, model=nmf_model, vectorizer=vectorizer)
+    else:
+        return DocModel(doctopics, topics, docnames=docnames, basisnames=vocab)
+    
+def umass_coherence(topics, counts, topn=10):
+    '''
+        UMass coherence of each topic, computed from document 
+            co-occurrences of its topn words w_1..w_n (ordered by weight):
+            sum over i>j of log((D(w_i,w_j) + 1) / D(w_j)), where D counts 
+            the documents containing all of the given words.
+        Output: array of coherence scores (one per topic).
+        Inputs:
+            topics: <Nf x Nvocab> array of topic word weights.
+            counts: sparse <Ndocs x Nvocab> matrix of counts.
+            topn: number of top words per topic to use.
+    '''
+    top = top_k_indices(np.asarray(topics), topn)
+    
+    # co-document frequencies of only the words that are used
+    cols = np.unique(top)
+    occurs = (counts[:,cols] > 0).astype(np.int64)
+    codocs = np.asarray((occurs.T @ occurs).todense())
+    docfreq = np.maximum(np.diag(codocs), 1)
+    
+    pos = np.searchsorted(cols, top)
+    pairs = codocs[pos[:,:,np.newaxis], pos[:,np.newaxis,:]] # [k,i,j] = D(w_i,w_j)
+    scores = np.log((pairs + 1) / docfreq[pos][:,np.newaxis,:])
+    lower = np.tril(np.ones((top.shape[1],top.shape[1]), dtype=bool), -1)
+    return (scores * lower).sum(axis=(1,2))
+
+_SWEEP = dict()
+
+def _init_sweep_worker(corpus):
+    _SWEEP['corpus'] = corpus
+
+def _fit_sweep_model(kind, n_topics, seed, kwargs):
+    '''
+        Fits one topic model on the shared corpus.
+        Output: (model, doctopics, score) where score is perplexity for lda
+            and reconstruction error for nmf.
+    '''
+    corpus = _SWEEP['corpus']
+    if kind == 'lda':
+        kwargs = {'learning_method':'online', **kwargs}
+        model = LatentDirichletAllocation(n_components=n_topics, random_state=seed, **kwargs).fit(corpus)
+        score = model.perplexity(corpus)
+    else:
+        model = NMF(n_components=n_topics, random_state=seed, **kwargs).fit(corpus)
+        score = model.reconstruction_err_
+    return model, model.transform(corpus), score
+
+def topic_sweep(docbows, n_topics, seeds=(0,), kind='lda', min_tf=2, n_process=1, docnames=None, include_model=False, topn=10, **kwargs):
+    '''
+        Trains lda or nmf topic models for every combination of number 
+            of topics and seed. Documents are vectorized once and the
+            document-term matrix is shared by all models (and by worker
+            processes if n_process > 1).
+            
+        Output: (models, metrics) tuple, where models is a dictionary of
+            (n_topics, seed) -> DocModel and metrics is a dataframe with 
+            the same index giving perplexity (lda) or reconstruction 
+            error (nmf) and the mean UMass coherence of each model.
+        
+        Inputs: 
+            docbows: Iterable of document token iterables or TokenCorpus.
+            n_topics: list of numbers of topics.
+            seeds: list of random seeds.
+            kind: 'lda' or 'nmf'.
+            min_tf: Minimum number of documents a token must appear in.
+            n_process: number of worker processes used to fit models.
+            docnames: document names that will appear in DocModels.
+            topn: number of top words per topic used for coherence.
+            **kwargs: other keyword arguments fed directly into the 
+                sklearn LatentDirichletAllocation or NMF function.
+    '''
+    kind = kind.lower()
+    if kind not in ('lda','nmf'):
+        raise Exception('Topic model type {} was not recognized.'.format(kind))
+    
+    counts, vocab, vectorizer = count_vectorize(docbows, min_tf)
+    if kind == 'nmf':
+        tfidf = TfidfTransformer().fit(counts)
+        corpus = tfidf.transform(counts)
+        vectorizer = make_pipeline(vectorizer, tfidf)
     else:
-        return DocModel(doctopics, topics, vocab, docnames=docnames)
+        corpus = counts
+    
+    # fit models, largest first to balance worker loads
+    jobs = sorted([(k,seed) for k in n_topics for seed in seeds], reverse=True)
+    args = [(kind, k, seed, kwargs) for k,seed in jobs]
+    if n_process > 1:
+        with multiprocessing.Pool(n_process, initializer=_init_sweep_worker, initargs=(corpus,)) as pool:
+            results = pool.starmap(_fit_sweep_model, args)
+    else:
+        _init_sweep_worker(corpus)
+        results = [_fit_sweep_model(*a) for a in args]
+        _SWEEP.clear()
+    
+    models, rows = dict(), list()
+    for (k,seed), (model, doctopics, score) in sorted(zip(jobs, results), key=lambda x:x[0]):
+        topics = model.components_
+        if kind == 'lda':
+            topics = topics/topics.sum(axis=1)[:, np.newaxis]
+        
+        if include_model:
+            models[(k,seed)] = DocModel(doctopics, topics, docnames=docnames, basisnames=vocab, model=model, vectorizer=vectorizer)
+        else:
+            models[(k,seed)] = DocModel(doctopics, topics, docnames=docnames, basisnames=vocab)
+        
+        coherence = umass_coherence(topics, counts, topn)
+        rows.append({
+            'n_topics': k, 
+            'seed': seed, 
+            'perplexity' if kind=='lda' else 'reconstruction_err': score, 
+            'coherence': coherence.mean(),
+            'min_coherence': coherence.min(),
+        })
     
+    metrics = pd.DataFrame(rows).set_index(['n_topics','seed'])
+    return models, metrics
+
 def pretendsents(docsents):
     '''
         Shortcut to provide sentence list without copying to new variable
     '''
+    if isinstance(docsents, TokenCorpus):
+        for sent in docsents.iter_sents():
+            yield [docsents.words[i] for i in sent]
+        return
+    
     for doc in docsents:
         for sent in doc:
             yield sent
@@ -107,6 +427,11 @@ def pretenddocs(docsents):
     '''
         Shortcut to provide document list without copying to new variable.
     '''
+    if isinstance(docsents, TokenCorpus):
+        for i in range(len(docsents)):
+            yield docsents.doc_words(i)
+        return
+    
     for doc in docsents:
         yield [w for sent in doc for w in sent]
 
@@ -132,7 +457,7 @@ def calc_cutoffind(freqs,min_tf):
     
         
         
-def glove(docsents, n_dim, random_state=0, min_tf=1, docnames=None, keywords=None, **kwargs):
+def glove(docsents, n_dim, random_state=0, min_tf=1, docnames=None, keywords=None, dim_topn=None, doc_vectors='fit', n_process=1, **kwargs):
     
     '''
         Interface for Glove algorithm using python-glove package.
@@ -140,8 +465,8 @@ def glove(docsents, n_dim, random_state=0, min_tf=1, docnames=None, keywords=Non
         Output: Returns DocModel object containing the results of the word embedding.
         
         Inputs: 
-            docbows: Iterable of document token iterables (nested by document, will 
-                be flattened).
+            docsents: Iterable of document token iterables (nested by document, will 
+                be flattened), or TokenCorpus.
             n_dim: Number of dimensions to use in the embedding model.
             random_state: Integer for seeding random generator. Allows
                 for making reproducable embedding models.
@@ -155,24 +480,42 @@ def glove(docsents, n_dim, random_state=0, min_tf=1, docnames=None, keywords=Non
                 dimension of the vector space to hat + dog, and the second 
                 to the vector for cat minus the component in hat + dog to 
                 preserve orthogonality.
+            n_process: number of worker processes used to build the
+                cooccurrence matrix and fit document vectors.
             **kwargs: other keyword arguments fed directly into the 
                 sklearn NMF function.
     '''
     
-    # count frequencies
-    fdist = Counter([w for s in pretendsents(docsents) for w in s])
-    sfdist = list(sorted(fdist.items(),key=lambda x:x[1],reverse=True))
-    dictionary = {wf[0]:i for i,wf in enumerate(sfdist)}
-    cutoff = calc_cutoffind([f for w,f in sfdist],min_tf)
+    if isinstance(docsents, TokenCorpus):
+        # count frequencies (stable sort keeps first-seen order for ties, like Counter)
+        freqs = docsents.term_frequencies()
+        order = np.argsort(-freqs, kind='stable')
+        sfdist = [(docsents.words[i],freqs[i]) for i in order]
+        cutoff = calc_cutoffind([f for w,f in sfdist],min_tf)
+        
+        # calculate corpus matrix directly from token ids (words below the 
+        #   cutoff have ids >= cutoff and are skipped)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        matrix = cooccurrence_matrix(rank[docsents.ids], docsents.sent_indptr, cutoff, window=10, n_process=n_process)
+    
+    else:
+        # count frequencies
+        fdist = Counter([w for s in pretendsents(docsents) for w in s])
+        sfdist = list(sorted(fdist.items(),key=lambda x:x[1],reverse=True))
+        cutoff = calc_cutoffind([f for w,f in sfdist],min_tf)
+        dictionary = {wf[0]:i for i,wf in enumerate(sfdist[:cutoff])}
 
-    # calculate corpus matrix
-    corpus = Corpus(dictionary=dictionary)
-    corpus.fit(pretendsents(docsents), window=10) # GloVe found that bigger windows helped
-    corpus.matrix = corpus.matrix.tocsr()[:cutoff,:cutoff].tocoo()
+        # calculate corpus matrix, streaming sentences (words below the 
+        #   cutoff keep their positions but are not counted)
+        builder = CooccurrenceBuilder(cutoff, window=10) # GloVe found that bigger windows helped
+        for sent in pretendsents(docsents):
+            builder.add_sent([dictionary.get(w,-1) for w in sent])
+        matrix = builder.tocoo()
     
     # train glove model
     glove = Glove(no_components=n_dim, learning_rate=0.05, random_state=random_state)
-    glove.fit(corpus.matrix, **kwargs)
+    glove.fit(matrix, **kwargs)
     
     # modify dictionary after cutoff applied
     cutoff_dictionary = {wf[0]:i for i,wf in enumerate(sfdist) if wf[1]>min_tf}
@@ -183,18 +526,28 @@ def glove(docsents, n_dim, random_state=0, min_tf=1, docnames=None, keywords=Non
     if keywords is not None:
         glove = supervised_vectors(glove, keywords)
     
+    # document word counts with columns matching the glove dictionary
+    if isinstance(docsents, TokenCorpus):
+        counts = scipy.sparse.csr_matrix(
+            (np.ones(len(docsents.ids)), rank[docsents.ids], docsents.doc_indptr),
+            shape=(len(docsents), len(order)),
+            copy=True, # sum_duplicates() modifies arrays in place
+        )
+        counts.sum_duplicates()
+        counts = counts[:,:len(vocab)]
+    else:
+        counts = vocab_count_matrix(pretenddocs(docsents), glove.dictionary)
+    
     # transform documents to single vectors
-    transpar = lambda doc: glove_transform_paragraph(glove, doc,ignore_missing=True)
-    docvectors = [transpar(doc) for doc in pretenddocs(docsents)]
+    if doc_vectors == 'tfidf':
+        docvectors = tfidf_mean_vectors(glove.word_vectors[:len(vocab)], counts)
+    elif doc_vectors == 'fit':
+        docvectors = paragraph_vectors(glove, counts, n_process=n_process)
+    else:
+        raise Exception('doc_vectors should be "fit" or "tfidf", not {}.'.format(doc_vectors))
     
     # words associated with each dimension of the embedding space
-    dimwords = np.zeros((n_dim,len(vocab)))
-    for dim in range(n_dim):
-        # create natural basis unit vector
-        e = np.zeros(n_dim)
-        e[dim] = 1
-        for i,w in enumerate(vocab):
-            dimwords[dim,i] = glove_projection(glove, w, e)
-    
-    return DocModel(np.vstack(docvectors), dimwords, vocab, docnames=docnames)
+    dimwords = dimension_words(glove.word_vectors[:len(vocab)], topn=dim_topn)
+    
+    return DocModel(docvectors, dimwords, docnames=docnames, basisnames=vocab, word_vectors=glove.word_vectors[:len(vocab)])
     
\ No newline at end of file
@@ -1,9 +1,140 @@
 import pandas as pd
+import numpy as np
+import scipy.sparse
+import os
 import os.path
+import json
+import pickle
 import spacy
 import itertools
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.pipeline import Pipeline
 
-from .reports import write_report
+from .reports import write_report, top_k_indices, make_human_report
+from .easytext import easyparse, chunk_iter
+from .pipelines import DocTokens
+from .tokencorpus import vocab_count_matrix
+from .knn import VectorIndex, normalize_rows
+
+def choose_backend(matrix, max_density=0.25, min_size=10000):
+    '''
+        Returns matrix as a dense ndarray or scipy csr matrix depending on
+            the fraction of non-zero values. Small matrices are kept dense.
+        Inputs:
+            matrix: ndarray, list or scipy sparse matrix.
+            max_density: matrices with a smaller fraction of non-zero 
+                values are stored as sparse.
+            min_size: matrices with fewer elements are always dense.
+                If max_density is None, the matrix is kept as it is (used
+                when loading memory-mapped arrays).
+    '''
+    if max_density is None:
+        return matrix if scipy.sparse.issparse(matrix) else np.asarray(matrix)
+    
+    if scipy.sparse.issparse(matrix):
+        size = matrix.shape[0]*matrix.shape[1]
+        if size < min_size or matrix.nnz >= max_density*size:
+            return matrix.toarray()
+        return matrix.tocsr()
+    
+    matrix = np.asarray(matrix)
+    if matrix.size >= min_size and np.count_nonzero(matrix) < max_density*matrix.size:
+        return scipy.sparse.csr_matrix(matrix)
+    return matrix
+
+def split_labeled(data, rownames=None, colnames=None):
+    '''
+        Separates values from row/column labels of a dataframe or matrix.
+        Output: (values, rownames, colnames), where names default to ranges.
+    '''
+    if isinstance(data, pd.DataFrame):
+        if len(data.columns) > 0 and all(isinstance(dt, pd.SparseDtype) for dt in data.dtypes):
+            values = data.sparse.to_coo().tocsr()
+        else:
+            values = data.values
+        return values, list(data.index), list(data.columns)
+    
+    if not scipy.sparse.issparse(data):
+        data = np.asarray(data)
+    rownames = list(rownames) if rownames is not None else list(range(data.shape[0]))
+    colnames = list(colnames) if colnames is not None else list(range(data.shape[1]))
+    return data, rownames, colnames
+
+def row_values(matrix, i):
+    '''
+        Row i of a dense or sparse matrix as a 1d array.
+    '''
+    if scipy.sparse.issparse(matrix):
+        return matrix[i].toarray().ravel()
+    return np.asarray(matrix[i])
+
+def iter_row_blocks(matrix, block_size=1000):
+    '''
+        Yields (start, dense block) for blocks of rows of a dense or 
+            sparse matrix, so sparse matrices are never densified at once.
+    '''
+    for start in range(0, matrix.shape[0], block_size):
+        block = matrix[start:start+block_size]
+        if scipy.sparse.issparse(block):
+            block = block.toarray()
+        yield start, np.asarray(block, dtype=np.float64)
+
+def token_list(doc):
+    '''
+        List of token strings from DocTokens (the token_ids output of 
+            wordlist) or any iterable of tokens.
+    '''
+    if isinstance(doc, DocTokens):
+        return [doc.types[i] for i in doc.ids]
+    return list(doc)
+
+def vectorize_bows(vectorizer, bows):
+    '''
+        Applies vectorizer to bows (DocTokens or token lists). For a fitted
+            CountVectorizer or TfidfVectorizer (alone or as the first step 
+            of a Pipeline), tokens are counted directly into vocabulary
+            columns with vocab_count_matrix(), without expanding DocTokens
+            into token lists. Other vectorizers are given token lists.
+    '''
+    steps = vectorizer.steps if isinstance(vectorizer, Pipeline) else [(None, vectorizer)]
+    counter = steps[0][1]
+    if not isinstance(counter, CountVectorizer) or counter.binary or not hasattr(counter, 'vocabulary_'):
+        return vectorizer.transform([token_list(doc) for doc in bows])
+    
+    matrix = vocab_count_matrix(bows, counter.vocabulary_, dtype=counter.dtype)
+    if isinstance(counter, TfidfVectorizer):
+        matrix = counter._tfidf.transform(matrix, copy=False) # as in TfidfVectorizer.transform()
+    for name,step in steps[1:]:
+        matrix = step.transform(matrix)
+    return matrix
+
+def save_values(path, name, matrix):
+    '''
+        Saves dense or csr matrix as .npy files in path, so that they can be
+            memory-mapped by load_values(). Sparse matrices are saved as 
+            three files (name.data.npy, name.indices.npy, name.indptr.npy).
+        Output: manifest entry describing the saved matrix.
+    '''
+    if scipy.sparse.issparse(matrix):
+        matrix = matrix.tocsr()
+        for part in ('data','indices','indptr'):
+            np.save(os.path.join(path, '{}.{}.npy'.format(name,part)), getattr(matrix,part))
+        return {'backend':'csr', 'shape':list(matrix.shape), 'dtype':str(matrix.dtype)}
+    else:
+        np.save(os.path.join(path, '{}.npy'.format(name)), np.ascontiguousarray(matrix))
+        return {'backend':'dense', 'shape':list(matrix.shape), 'dtype':str(matrix.dtype)}
+
+def load_values(path, name, entry, mmap_mode='r'):
+    '''
+        Loads matrix saved by save_values() using its manifest entry.
+    '''
+    if entry['backend'] == 'csr':
+        parts = [np.load(os.path.join(path, '{}.{}.npy'.format(name,part)), mmap_mode=mmap_mode) for part in ('data','indices','indptr')]
+        return scipy.sparse.csr_matrix(tuple(parts), shape=tuple(entry['shape']), copy=False)
+    elif entry['backend'] == 'dense':
+        return np.load(os.path.join(path, '{}.npy'.format(name)), mmap_mode=mmap_mode)
+    else:
+        raise Exception('Unknown DocModel backend {} in manifest.'.format(entry['backend']))
 
 class DocModel:
     '''
@@ -11,8 +142,12 @@ class DocModel:
             to some number of dimensions.
         It is currently being used for LDA and NMF topic models and Glove
             document representations.
+        Values are stored as numpy arrays or scipy sparse matrices (chosen
+            by density, see choose_backend()) with separate label indices.
+            The doc_feat and feat_basis dataframes are only built when 
+            accessed.
     '''
-    def __init__(self, doc_features, feature_basis=None, docnames=None, featnames=None, basisnames=None, df_type=pd.SparseDataFrame, vectorizer=None, model=None):
+    def __init__(self, doc_features, feature_basis=None, docnames=None, featnames=None, basisnames=None, df_type=None, vectorizer=None, model=None, max_density=0.25, word_vectors=None):
         
         '''
             Represents Nd documents according to Nf features which are composed
@@ -21,73 +156,116 @@ class DocModel:
             Inputs:
                 doc_features: <Nd x Nf> matrix of document representations.
                     (i.e. topic distributions, embedding vectors, etc)
+                    Can be a dataframe, ndarray, list or scipy sparse matrix.
                 feature_words: <Nf x Nt> matrix of feature representations
                     in terms of tokens (or some arbitrary basis more generally).
                 docnames: a convenient input of document names that will be 
                     return in class methods.
+                df_type: dataframe class used to build doc_feat and 
+                    feat_basis views (pd.DataFrame by default).
                 model: arbitrary object for storing original sklearn LDA, NMF
                     or glove models with associated training parameters.
+                max_density: matrices with a smaller fraction of non-zero 
+                    values are stored as scipy sparse matrices.
+                word_vectors: optional <Nt x n_dim> array of word vectors
+                    (i.e. from glove), with rows matching basisnames. Used 
+                    for word nearest-neighbour queries instead of the 
+                    columns of feature_basis. Stored normalized.
                 dat: arbitrary data for docmodel storage. One may, for instance,
                     want to attach data from a model which is output from an algorithm
                         such as lda or nmf which can be used later.
         '''
         
-        # convert doc_features to dataframe
-        if isinstance(doc_features, pd.DataFrame) or isinstance(doc_features, list):
-            self.doc_feat = df_type(doc_features)
-            self.doc_feat.columns.name = 'feature'
-            self.doc_feat.index.name = 'docname'
-        else:
-            # create dataframe with provided docnames and featnames
-            self.doc_feat = df_type(doc_features)
-            
-            docrange = list(range(doc_features.shape[0]))
-            docnames = list(docnames) if docnames is not None else docrange
+        # separate doc_features values from labels
+        values, docnames, featnames = split_labeled(doc_features, docnames, featnames)
+        self.doc_feat_values = choose_backend(values, max_density)
+        self.docnames = pd.Index(docnames, name='docname')
+        self.featnames = pd.Index(featnames, name='feature')
             
-            featrange = list(range(doc_features.shape[1]))
-            featnames = list(featnames) if featnames is not None else featrange
+        self.Ndocs = self.doc_feat_values.shape[0]
+        self.Nfeat = self.doc_feat_values.shape[1]
             
-            self.doc_feat.index = docnames
-            self.doc_feat.index.name = 'docname'
-            self.doc_feat.columns = featnames
-            self.doc_feat.columns.name = 'feature'
             
-        self.Ndocs = self.doc_feat.shape[0]
-        self.Nfeat = self.doc_feat.shape[1]
-            
-            
-        # format feature_basis dataframe
-        self.feat_basis = None #(in case not assigned later)
+        # format feature_basis values
+        self.feat_basis_values = None #(in case not assigned later)
+        self.basisnames = None
         self.Nbasis = None
+        self.topk_basis = scipy.sparse.issparse(feature_basis) # i.e. from dimension_words(topn=...)
         if feature_basis is not None:
-            assert(doc_features.shape[1] == feature_basis.shape[0])
+            assert(self.Nfeat == feature_basis.shape[0])
             
-            if isinstance(feature_basis, pd.DataFrame) or isinstance(doc_features, list):
-                self.feat_basis = df_type(feature_basis)
-                self.feat_basis.columns.name = 'feature'
-                self.feat_basis.index.name = 'docname'
-            else:
-                self.feat_basis = df_type(feature_basis)
-                
-                basisrange = list(range(feature_basis.shape[1]))
-                basisnames = list(basisnames) if basisnames is not None else basisrange
+            values, _, basisnames = split_labeled(feature_basis, featnames, basisnames)
+            # top-k bases stay sparse, however dense they are
+            self.feat_basis_values = choose_backend(values, None if self.topk_basis else max_density)
+            self.basisnames = pd.Index(basisnames, name='basis')
                 
-                self.feat_basis.index = self.doc_feat.columns
-                self.feat_basis.columns = basisnames
-                self.feat_basis.columns.name = 'basis'
-                
-            self.Nbasis = self.feat_basis.shape[1]
+            self.Nbasis = self.feat_basis_values.shape[1]
+        
+        self.word_vectors = None
+        if word_vectors is not None:
+            if self.basisnames is None or len(word_vectors) != self.Nbasis:
+                raise Exception('word_vectors should have one row per basis name.')
+            self.word_vectors = normalize_rows(word_vectors)
             
         
         # optional data for storage
         self.vectorizer = vectorizer
         self.model = model
-        self.df_type = df_type
+        self.df_type = df_type if df_type is not None else pd.DataFrame
+        
+        # cached dataframe views and row rankings used in summaries
+        self._views = dict()
+        self._rankings = dict() # key -> (topn, rankings)
+        self._nlp = None # spacy model loaded by transform methods
+        self.indices = dict() # 'words'/'docs' -> VectorIndex
         
     
     def check_feat_basis(self):
-        if self.feat_basis is None:
+        if self.feat_basis_values is None:
             raise Exception('feature_basis has not been provided.')
+    
+    def make_view(self, values, rownames, colnames):
+        '''
+            Builds dataframe of values with the given label indices.
+        '''
+        if scipy.sparse.issparse(values):
+            df = pd.DataFrame.sparse.from_spmatrix(values, index=rownames, columns=colnames)
+        else:
+            df = pd.DataFrame(values, index=rownames, columns=colnames)
+        if self.df_type is not pd.DataFrame:
+            df = self.df_type(df)
+        return df
+    
+    @property
+    def doc_feat(self):
+        '''
+            <Nd x Nf> dataframe view of doc_feat_values.
+        '''
+        if 'doc_feat' not in self._views:
+            self._views['doc_feat'] = self.make_view(self.doc_feat_values, self.docnames, self.featnames)
+        return self._views['doc_feat']
+    
+    @property
+    def feat_basis(self):
+        '''
+            <Nf x Nt> dataframe view of feat_basis_values (or None).
+        '''
+        if self.feat_basis_values is None:
+            return None
+        if 'feat_basis' not in self._views:
+            self._views['feat_basis'] = self.make_view(self.feat_basis_values, self.featnames, self.basisnames)
+        return self._views['feat_basis']
+    
+    @property
+    def feat_doc_values(self):
+        '''
+            <Nf x Nd> transpose of doc_feat_values.
+        '''
+        if scipy.sparse.issparse(self.doc_feat_values):
+            if 'feat_doc_values' not in self._views:
+                self._views['feat_doc_values'] = self.doc_feat_values.T.tocsr()
+            return self._views['feat_doc_values']
+        return self.doc_feat_values.T
             
     
     # ________ Access Dataframe Features _________
@@ -103,7 +281,7 @@ class DocModel:
                 topn: number of feature ids to return.
         '''
                 
-        return self.get_row(self.doc_feat, doc, sort=sort, topn=topn)
+        return self.get_values_row(self.doc_feat_values, self.docnames, self.featnames, doc, sort=sort, topn=topn)
     
         
     def get_feature_docs(self, feature, sort=False, topn=None):
@@ -114,7 +292,7 @@ class DocModel:
                 topn: number of document ids to return.
         '''
         
-        return self.get_row(self.doc_feat.T, feature, sort=sort, topn=topn)
+        return self.get_values_row(self.feat_doc_values, self.featnames, self.docnames, feature, sort=sort, topn=topn)
     
     
     def get_feature_basis(self, feature, sort=False, topn=None):
@@ -126,14 +304,35 @@ class DocModel:
         '''
         self.check_feat_basis()
         
-        return self.get_row(self.feat_basis, feature, sort=sort, topn=topn)
+        return self.get_values_row(self.feat_basis_values, self.featnames, self.basisnames, feature, sort=sort, topn=topn)
+    
+    @staticmethod
+    def get_values_row(values, rownames, colnames, ind, sort=True, topn=None):
+        '''
+            Array version of get_row(): returns row ind of values as a
+                series indexed by colnames, either sorted or not.
+            Input:
+                values: dense or sparse matrix.
+                rownames: pd.Index of row labels.
+                colnames: pd.Index of column labels.
+                ind: label of row to be extracted.
+                sort: return feat most closely associated with 
+                    the doc.
+                topn: number of feature ids to return.
+        '''
+        assert(ind in rownames)
+        row = row_values(values, rownames.get_loc(ind))
+        if not sort:
+            return pd.Series(row, index=colnames, name=ind)
+        else:
+            order = top_k_indices(row[np.newaxis,:], topn)[0]
+            return pd.Series(row[order], index=colnames[order], name=ind)
         
     @staticmethod
     def get_row(df, ind, sort=True, topn=None):
         '''
             Utility function that returns row(s) or column(s) of
-                df, either sorted or not. Used in get_doc_features
-                and other similar functions.
+                df, either sorted or not.
             Input:
                 df: dataframe of values (feat_basis or doc_feat)
                 ind: index of row/col (on axis) to be extracted
@@ -141,12 +340,8 @@ class DocModel:
                     the doc.
                 topn: number of feature ids to return.
         '''
-        assert(ind in df.index)
-        if not sort:
-            return df.loc[ind,:]
-        else:
-            top = df.loc[ind,:].sort_values(ascending=False)
-            return top[:topn]
+        values, rownames, colnames = split_labeled(df)
+        return DocModel.get_values_row(values, pd.Index(rownames), pd.Index(colnames), ind, sort=sort, topn=topn)
         
     
     # ________ Create Summary DataFrames _________
@@ -160,7 +355,7 @@ class DocModel:
                 topn: number of feature ids to return.
                 human: T/F output human readable series
         '''
-        df = self.get_summary(self.doc_feat, topn=topn, human=human)
+        df = self.get_values_summary(self.doc_feat_values, self.docnames, self.featnames, topn=topn, human=human, cachekey='doc_feat')
         
         return df
         
@@ -173,7 +368,7 @@ class DocModel:
                 human: T/F output human readable series
         '''
 
-        df = self.get_summary(self.doc_feat.T, topn=topn, human=human).T
+        df = self.get_values_summary(self.feat_doc_values, self.featnames, self.docnames, topn=topn, human=human, cachekey='feat_doc').T
         
         return df
     
@@ -187,54 +382,91 @@ class DocModel:
         '''
         self.check_feat_basis()
 
-        df = self.get_summary(self.feat_basis, topn=topn, human=human)
+        df = self.get_values_summary(self.feat_basis_values, self.featnames, self.basisnames, topn=topn, human=human, cachekey='feat_basis')
         
         return df
         
-    def get_summary(self, df, topn=None, human=False):
+    def get_ranking(self, values, topn=None, cachekey=None):
+        '''
+            Column indices of the topn largest values in each row, ordered
+                from largest to smallest. Rankings are cached by cachekey, 
+                so later calls with the same or a smaller topn just slice
+                the cached array. Sparse matrices are ranked in blocks of 
+                rows.
+            Input:
+                values: 2d dense or sparse matrix of values.
+                topn: number of columns to rank for each row (all if None).
+                cachekey: name of values for caching. Not cached if None.
+        '''
+        if cachekey is not None and cachekey in self._rankings:
+            cached_topn, ranking = self._rankings[cachekey]
+            if cached_topn is None or (topn is not None and topn <= cached_topn):
+                return ranking[:,:topn]
+        
+        if scipy.sparse.issparse(values):
+            ranking = np.vstack([top_k_indices(block, topn) for start,block in iter_row_blocks(values)])
+        else:
+            ranking = top_k_indices(np.asarray(values, dtype=np.float64), topn)
+        
+        if cachekey is not None:
+            self._rankings[cachekey] = (topn, ranking)
+        return ranking
+    
+    def get_summary(self, df, topn=None, human=False, cachekey=None):
         '''
             Utility function that summarizes df by sorting 
                 rows. To sort by columns, simply transpose the input
                 dataframe before passing to this function.
-                TODO: better description
             Input:
                 df: dataframe of values (feat_basis or doc_feat)
                 topn: number of feature ids to return.
                 human: T/F output human readable series
+                cachekey: name for caching row rankings of df 
+                    (see get_ranking()).
+        '''
+        values, rownames, colnames = split_labeled(df)
+        return self.get_values_summary(values, pd.Index(rownames), pd.Index(colnames), topn=topn, human=human, cachekey=cachekey)
+    
+    def get_values_summary(self, values, rownames, colnames, topn=None, human=False, cachekey=None):
+        '''
+            Array version of get_summary().
+            Input:
+                values: dense or sparse matrix.
+                rownames: pd.Index of row labels.
+                colnames: pd.Index of column labels.
+                topn: number of feature ids to return.
+                human: T/F output human readable series
+                cachekey: name for caching row rankings of values 
+                    (see get_ranking()).
         '''
+        ranking = self.get_ranking(values, topn=topn, cachekey=cachekey)
+        colarr = np.asarray(colnames, dtype=object)
+        
         if not human:
-            if topn is None:
-                columns = range(df.shape[1])
-            else:
-                columns = range(topn)
-            
             # summaries by placing index values into dataframe
-            summary_df = pd.DataFrame(index=df.index, columns=columns)
+            summary_df = pd.DataFrame(colarr[ranking], index=rownames, columns=range(ranking.shape[1]))
             summary_df.columns.name = 'nth_closest'
-            for ind in df.index:
-                row = self.get_row(df, ind, sort=True, topn=topn)
-                summary_df.loc[ind,:] = list(row.index)
             return summary_df
         
         else:
             
-            # create multiindex for human summary
-            prod = itertools.product(df.index, df.columns)
-            mi = pd.MultiIndex.from_tuples(list(prod))
-            hs = pd.Series(df.values.flatten(),index=mi)
-
-            # sort on values and then index
-            hs = hs.sort_values(ascending=False)
-            hs = hs.sort_index(level=0, sort_remaining=False)
+            # gather ranked values (in blocks for sparse matrices)
+            vals = np.vstack([np.take_along_axis(block, ranking[start:start+block.shape[0]], axis=1) for start,block in iter_row_blocks(values)])
+            
+            # create multiindex for human summary, sorted on index and then values
+            roworder = np.asarray(rownames.argsort())
+            ranking, vals = ranking[roworder], vals[roworder]
+            mi = pd.MultiIndex.from_arrays([np.repeat(np.asarray(rownames)[roworder], ranking.shape[1]), colarr[ranking].ravel()])
+            hs = pd.Series(vals.ravel(),index=mi)
             hs = hs.dropna()
             
             # adding totals rows
             totcolname = '__Totals__'
-            #tots = df.sum(axis=0).sort_values(ascending=False)
-            tots = df.sum(axis=0,skipna=True)#.sort_values(ascending=False)
-            tmi = pd.MultiIndex.from_tuples([(totcolname, c) for c in df.columns])
-            ts = pd.Series(tots.values,index=tmi).sort_values(ascending=False)
-            hs = ts.append(hs)
+            tots = np.sum([np.nansum(block, axis=0) for start,block in iter_row_blocks(values)], axis=0)
+            totorder = np.argsort(-tots, kind='stable')
+            tmi = pd.MultiIndex.from_arrays([np.full(len(totorder), totcolname, dtype=object), colarr[totorder]])
+            ts = pd.Series(tots[totorder],index=tmi)
+            hs = pd.concat([ts, hs])
             
             return hs
         
@@ -242,36 +474,342 @@ class DocModel:
     
     # ---------- Other Functions ----------
     
-    def transform(self, bows, docnames=None, lang='en'):
+    def check_model(self):
+        if self.model is None or self.vectorizer is None:
+            raise Exception('Need to provide model & vectorizer \
+                    in DocModel constructor to use .transform()')
+    
+    def get_nlp(self, nlp=None, lang='en'):
         '''
-            Utility function that summarizes df by sorting 
-                rows/columns. Needs .model and .vectorizer
+            Returns nlp if provided, otherwise a spacy model that is loaded
+                once and kept for later calls.
+        '''
+        if nlp is not None:
+            return nlp
+        if self._nlp is None:
+            self._nlp = spacy.load(lang)
+        return self._nlp
+    
+    def transform_array(self, docs, nlp=None, lang='en', pipeargs=dict(), **parsekwargs):
+        '''
+            Computes document features for a single batch of documents.
+            Output: <Ndocs x Nf> numpy array.
+            Input:
+                docs: list of raw texts (str), token lists or DocTokens. 
+                    Raw texts are parsed together with easyparse() using 
+                    the wordlist component.
+                nlp: spacy nlp object used for raw texts. If None, 
+                    spacy.load(lang) is called once and reused.
+                pipeargs: pipeargs passed to easyparse(). Should match 
+                    those used to create the training bows.
+                parsekwargs: other arguments passed to easyparse().
+        '''
+        self.check_model()
+        
+        bows = list(docs)
+        textinds = [i for i,doc in enumerate(bows) if isinstance(doc, str)]
+        
+        # parse all raw texts in the batch at once
+        if len(textinds) > 0:
+            texts = [bows[i] for i in textinds]
+            parsed = easyparse(self.get_nlp(nlp, lang), texts, enable=['wordlist',], pipeargs={**pipeargs, 'token_ids':True}, **parsekwargs)
+            for i,etdoc in zip(textinds, parsed):
+                bows[i] = etdoc['wordlist']
+        
+        return self.bows_features(bows)
+    
+    def transform_batches(self, docs, batch_size=1000, nlp=None, lang='en', pipeargs=dict(), **parsekwargs):
+        '''
+            Generator version of transform_array() for streams of documents.
+                Yields one <batch_size x Nf> numpy array for each batch 
+                of docs (the last one may be smaller). Raw texts of all 
+                batches are parsed by a single easyparse() stream, so the 
+                spacy pipeline is only built once.
+            Input:
+                docs: iterable of raw texts (str), token lists or DocTokens.
+                batch_size: number of documents per output array.
+                (other inputs are passed to transform_array())
+        '''
+        self.check_model()
+        
+        # texts are read ahead by easyparse, other docs wait in the tee buffer
+        docs, textdocs = itertools.tee(docs)
+        texts = (doc for doc in textdocs if isinstance(doc, str))
+        parsed = None
+        
+        for batch in chunk_iter(docs, batch_size):
+            if parsed is None and any(isinstance(doc, str) for doc in batch):
+                parsed = easyparse(self.get_nlp(nlp, lang), texts, enable=['wordlist',], pipeargs={**pipeargs, 'token_ids':True}, **parsekwargs)
+            bows = [next(parsed)['wordlist'] if isinstance(doc, str) else doc for doc in batch]
+            yield self.bows_features(bows)
+    
+    def bows_features(self, bows):
+        '''
+            Document features of DocTokens or token lists, using the stored
+                vectorizer and model (see vectorize_bows()).
+            Output: <Ndocs x Nf> numpy array.
+        '''
+        corpus = vectorize_bows(self.vectorizer, bows)
+        return np.asarray(self.model.transform(corpus))
+    
+    def transform(self, bows, docnames=None, lang='en', nlp=None):
+        '''
+            Computes document features of new documents using the stored
+                vectorizer and model. Needs .model and .vectorizer
                 to be provided. Custom objects can be provided
                 as long as they have .transform() methods.
+            Output: <Ndocs x Nf> dataframe with docnames as index.
             Input:
-                df: dataframe of values (feat_basis or doc_feat)
-                axis: basis axis to sort from. 0 means it will keep
-                    rows and sort columns for each row. 1 is vice-versa.
-                topn: number of feature ids to return.
+                bows: list of raw texts (str), token lists or DocTokens.
+                docnames: index of output dataframe.
+                lang: spacy model loaded if raw texts are passed and nlp
+                    is None.
         '''
         
-        if self.model is None or self.vectorizer is None:
-            raise Exception('Need to provide model & vectorizer \
-                    in DocModel constructor to use .transform()')
-        
         if docnames is None:
             docnames = list(range(len(bows)))
         
-        # tokenize texts
-        corpus = self.vectorizer.transform(bows)
-        
-        # actually construct dotopics
-        doc_features = self.model.transform(corpus)
+        doc_features = self.transform_array(bows, nlp=nlp, lang=lang)
         
         # return dataframe
-        df = self.df_type(doc_features, index=docnames, columns=self.doc_feat.columns)
+        df = self.df_type(doc_features, index=docnames, columns=self.featnames)
         df.index.name = 'docname'
         return df
     
+    def write_report(self, fname, save_wordmatrix=True, featurename='feature', hdf_if_fail=True, topn=30, verbose=True):
+        '''
+            Writes spreadsheet (or hdf) report of the model using 
+                reports.write_report().
+            Input:
+                fname: output file path (.xls, .xlsx, .h5 or .hdf).
+                save_wordmatrix: include the full <Nf x Nt> feature_basis
+                    matrix (can be very large).
+                featurename: name of features used in sheet names 
+                    (i.e. 'topic' or 'dimension').
+                hdf_if_fail: save as hdf if the excel file is too big.
+                topn: number of basis objects to list for each feature.
+        '''
+        sheets = list()
+        sheets.append(('doc_{}s'.format(featurename), self.doc_feat))
+        sheets.append(('{}_docs'.format(featurename), self.get_feature_doc_summary(topn=topn)))
+        if self.feat_basis_values is not None:
+            sheets.append(('{}_summary'.format(featurename), self.get_feature_summary(topn=topn)))
+            if save_wordmatrix and self.topk_basis:
+                # only list stored values of top-k matrices
+                sheets.append(('{}_words'.format(featurename), make_human_report(self.feat_basis).to_frame()))
+            elif save_wordmatrix:
+                sheets.append(('{}_words'.format(featurename), self.feat_basis))
+        
+        return write_report(fname, sheets, hdf_if_fail=hdf_if_fail, verbose=verbose)
+    
+    # ---------- Nearest Neighbours ----------
+    
+    def get_vectors(self, kind):
+        '''
+            Returns (vectors, names) of documents (rows of doc_feat) or 
+                words. Word vectors are the stored word_vectors (i.e. from
+                glove) or otherwise the columns of a dense feat_basis. 
+                Sparse (top-k) feat_basis columns are not word vectors, so 
+                they raise an exception.
+        '''
+        if kind == 'docs':
+            values, names = self.doc_feat_values, self.docnames
+        elif kind == 'words' and self.word_vectors is not None:
+            values, names = self.word_vectors, self.basisnames
+        elif kind == 'words':
+            self.check_feat_basis()
+            if self.topk_basis:
+                raise Exception('feat_basis only stores the top values of each feature, so its columns '
+                    'are not word vectors. Pass word_vectors to DocModel to build a word index.')
+            values, names = self.basis_feat_values, self.basisnames
+        else:
+            raise Exception('kind should be "words" or "docs", not {}.'.format(kind))
+        
+        if scipy.sparse.issparse(values):
+            values = values.toarray()
+        return values, names
+    
+    @property
+    def basis_feat_values(self):
+        '''
+            <Nt x Nf> transpose of feat_basis_values.
+        '''
+        if scipy.sparse.issparse(self.feat_basis_values):
+            return self.feat_basis_values.T.tocsr()
+        return self.feat_basis_values.T
+    
+    def build_index(self, kind='words', mode='exact', **kwargs):
+        '''
+            Builds a cosine similarity VectorIndex over word or document 
+                vectors, used by most_similar(). Indices are saved along 
+                with the model in DocModel.save().
+            Input:
+                kind: 'words' (word_vectors, or columns of a dense 
+                    feat_basis) or 'docs' (rows of doc_feat).
+                mode: 'exact' or 'ivf' (approximate, see VectorIndex).
+                kwargs: passed to VectorIndex.
+        '''
+        vectors, names = self.get_vectors(kind)
+        self.indices[kind] = VectorIndex(vectors, names, mode=mode, **kwargs)
+        return self.indices[kind]
+    
+    def get_index(self, kind):
+        if kind not in self.indices:
+            self.build_index(kind)
+        return self.indices[kind]
+    
+    def find_key(self, key):
+        '''
+            Whether key is a word ('words') or document name ('docs').
+        '''
+        if self.basisnames is not None and key in self.basisnames:
+            return 'words'
+        elif key in self.docnames:
+            return 'docs'
+        raise Exception('{} is not a word or document name of this model.'.format(key))
+    
+    def most_similar(self, key, topn=10, among=None):
+        '''
+            Words or documents with vectors most similar (by cosine 
+                similarity) to the vector of a given word or document. 
+                Builds an exact index the first time it is needed.
+            Output: pd.Series of similarities indexed by word or docname.
+            Input:
+                key: word or document name (words are checked first).
+                topn: number of neighbours to return.
+                among: 'words' or 'docs' to search. Defaults to the kind 
+                    of key.
+        '''
+        kind = self.find_key(key)
+        among = kind if among is None else among
+        
+        if among == kind:
+            return self.get_index(among).most_similar(key, topn)
+        else:
+            return self.get_index(among).most_similar_vector(self.get_index(kind).get_vector(key), topn).rename(key)
+    
+    def most_similar_batch(self, keys, topn=10, among='words', kind=None):
+        '''
+            Batch version of most_similar() for a list of words or 
+                document names of the same kind.
+            Output: (names, similarities) tuple of dataframes with keys as
+                index and neighbour rank as columns.
+        '''
+        kind = self.find_key(keys[0]) if kind is None else kind
+        source = self.get_index(kind)
+        index = self.get_index(among)
+        
+        inds = source.names.get_indexer(keys)
+        if np.any(inds < 0):
+            raise Exception('Not all keys were found among the {}.'.format(kind))
+        exclude = inds if among == kind else None
+        ids, scores = index.query(source.vectors[inds], topn, exclude=exclude)
+        
+        names = np.where(ids >= 0, np.asarray(index.names, dtype=object)[ids], None)
+        names_df = pd.DataFrame(names, index=keys)
+        scores_df = pd.DataFrame(scores, index=keys)
+        names_df.columns.name = scores_df.columns.name = 'nth_closest'
+        return names_df, scores_df
+    
+    # ---------- Save and Load ----------
+    
+    def save(self, path):
+        '''
+            Saves model to folder path in a binary format that can be 
+                loaded quickly using DocModel.load(). Values are saved as
+                .npy files (which can be memory-mapped), labels as a pickle, 
+                vectorizer and model as a pickle, and a manifest.json 
+                describing the contents.
+            Input:
+                path: output folder. Will be created if it doesn't exist.
+        '''
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        
+        manifest = {'format':'easytext-docmodel', 'version':1}
+        manifest['doc_feat'] = save_values(path, 'doc_feat', self.doc_feat_values)
+        if self.feat_basis_values is not None:
+            manifest['feat_basis'] = save_values(path, 'feat_basis', self.feat_basis_values)
+        if self.word_vectors is not None:
+            manifest['word_vectors'] = save_values(path, 'word_vectors', self.word_vectors)
+        manifest['topk_basis'] = self.topk_basis
+        
+        labels = {
+            'docnames': list(self.docnames),
+            'featnames': list(self.featnames),
+            'basisnames': list(self.basisnames) if self.basisnames is not None else None,
+        }
+        with open(os.path.join(path, 'labels.pkl'), 'wb') as f:
+            pickle.dump(labels, f, protocol=pickle.HIGHEST_PROTOCOL)
+        
+        manifest['has_model'] = self.model is not None or self.vectorizer is not None
+        if manifest['has_model']:
+            with open(os.path.join(path, 'model.pkl'), 'wb') as f:
+                pickle.dump({'model':self.model, 'vectorizer':self.vectorizer}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        
+        manifest['indices'] = list()
+        for kind, index in self.indices.items():
+            index.save(os.path.join(path, 'index_{}'.format(kind)))
+            manifest['indices'].append(kind)
+        
+        # written last so a folder with a manifest is complete
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    
+    @classmethod
+    def load(cls, path, mmap_mode='r', load_model=True):
+        '''
+            Loads model saved with DocModel.save().
+            Input:
+                path: folder the model was saved to.
+                mmap_mode: passed to np.load. The default 'r' memory-maps
+                    the saved arrays read-only, so loading is fast and 
+                    several processes can share the same model without 
+                    copying. Use None to read arrays into memory.
+                load_model: also unpickle the vectorizer and model (needed
+                    for .transform()).
+        '''
+        mfname = os.path.join(path, 'manifest.json')
+        if not os.path.isfile(mfname):
+            raise Exception('No DocModel manifest found in {}.'.format(path))
+        with open(mfname, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != 'easytext-docmodel':
+            raise Exception('{} is not a saved DocModel.'.format(path))
+        
+        with open(os.path.join(path, 'labels.pkl'), 'rb') as f:
+            labels = pickle.load(f)
+        
+        doc_feat = load_values(path, 'doc_feat', manifest['doc_feat'], mmap_mode)
+        feat_basis = None
+        if 'feat_basis' in manifest:
+            feat_basis = load_values(path, 'feat_basis', manifest['feat_basis'], mmap_mode)
+        word_vectors = None
+        if 'word_vectors' in manifest:
+            word_vectors = load_values(path, 'word_vectors', manifest['word_vectors'], mmap_mode)
+        
+        model, vectorizer = None, None
+        if load_model and manifest['has_model']:
+            with open(os.path.join(path, 'model.pkl'), 'rb') as f:
+                stored = pickle.load(f)
+            model, vectorizer = stored['model'], stored['vectorizer']
+        
+        docmodel = cls(
+            doc_feat, 
+            feat_basis, 
+            docnames=labels['docnames'], 
+            featnames=labels['featnames'], 
+            basisnames=labels['basisnames'],
+            vectorizer=vectorizer,
+            model=model,
+            max_density=None, # keep saved backends
+        )
+        docmodel.word_vectors = word_vectors # already normalized
+        docmodel.topk_basis = manifest.get('topk_basis', scipy.sparse.issparse(feat_basis))
+        for kind in manifest.get('indices', list()):
+            docmodel.indices[kind] = VectorIndex.load(os.path.join(path, 'index_{}'.format(kind)), mmap_mode=mmap_mode)
+        
+        return docmodel
+    
     
     
@@ -1,25 +1,93 @@
 
 from .pipelines import *
 
-from collections import Counter
+from collections import Counter, deque
 from spacy.tokens import Doc
+import multiprocessing
 import string
+import spacy
 
 
 
 # VVVVVVVVVVVVVVVVVVVV PIPELINE COMPONENTS VVVVVVVVVVVVVVVVVVVVVVV
 
 # NOTE NOTE NOTE: Do not have circular dependenceies "OR ELSE."
+# 'spacy_dep' lists every spacy component the easytext component reads from, 
+#   and 'pipearg_spacy_dep' lists additional ones needed when a pipearg is set
+#   (likewise 'pipearg_easytext_dep' for easytext components).
+#   Spacy components not needed by any enabled component are disabled in easyparse.
 ALL_COMPONENTS = {
-    'wordlist':{'comp':ExtractWordListPipeline,'easytext_dep':[], 'spacy_dep':['sbd',]},
-    'sentlist':{'comp':ExtractSentListPipeline,'easytext_dep':[], 'spacy_dep':['sbd',]},
-    'entlist':{'comp':ExtractEntListPipeline, 'easytext_dep':[], 'spacy_dep':['ner','parser']},
-    'prepphrases':{'comp':ExtractPrepositionsPipeline,'easytext_dep':[], 'spacy_dep':[]},
-    'nounverbs':{'comp':ExtractNounVerbsPipeline, 'easytext_dep':[], 'spacy_dep':[]},
-    'entverbs':{'comp':ExtractEntVerbsPipeline, 'easytext_dep':['entlist',], 'spacy_dep':[]},
-    'nounphrases':{'comp':ExtractNounPhrasesPipeline, 'easytext_dep':[], 'spacy_dep':[]},
+    'wordlist':{'comp':ExtractWordListPipeline,'easytext_dep':[], 'spacy_dep':[], 'pipearg_spacy_dep':{'use_ents':['ner',]}, 'pipearg_easytext_dep':{'use_ents':['mergeents',]}},
+    'sentlist':{'comp':ExtractSentListPipeline,'easytext_dep':[], 'spacy_dep':['sbd',], 'pipearg_spacy_dep':{'use_ents':['ner',]}, 'pipearg_easytext_dep':{'use_ents':['mergeents',]}},
+    'entlist':{'comp':ExtractEntListPipeline, 'easytext_dep':['mergeents',], 'spacy_dep':['ner',]},
+    'prepphrases':{'comp':ExtractPrepositionsPipeline,'easytext_dep':[], 'spacy_dep':['tagger','parser']},
+    'nounverbs':{'comp':ExtractNounVerbsPipeline, 'easytext_dep':[], 'spacy_dep':['tagger','parser']},
+    'entverbs':{'comp':ExtractEntVerbsPipeline, 'easytext_dep':['entlist',], 'spacy_dep':['tagger','parser']},
+    'nounphrases':{'comp':ExtractNounPhrasesPipeline, 'easytext_dep':[], 'spacy_dep':['tagger',], 'pipearg_spacy_dep':{'parse_nounphrases':['parser',]}},
 }
 
+# components that only prepare the doc for other components (no output key)
+HELPER_COMPONENTS = {
+    'mergeents':{'comp':MergeEntitiesPipeline, 'easytext_dep':[], 'spacy_dep':['ner',]},
+}
+
+# components computed in a single pass by ExtractFusedPipeline when more than 
+#   one of them is enabled (see build_pipeline())
+FUSED_COMPONENTS = ('wordlist','sentlist','prepphrases','nounverbs','entverbs')
+FUSED_NAME = 'fused'
+
+PIPE_COMPONENTS = {**ALL_COMPONENTS, **HELPER_COMPONENTS}
+
+def is_easytext_pipe(pname):
+    return pname in PIPE_COMPONENTS or pname == FUSED_NAME
+
+def component_deps(comp, kind, pipeargs):
+    '''
+        Dependencies of a component entry, where kind is 'spacy' or 
+            'easytext', including those that apply to set pipeargs.
+    '''
+    deps = list(comp[kind+'_dep'])
+    for arg, pdeps in comp.get('pipearg_'+kind+'_dep', dict()).items():
+        if pipeargs.get(arg):
+            deps += [d for d in pdeps if d not in deps]
+    return deps
+
+def fused_component(names, components):
+    '''
+        Component entry for ExtractFusedPipeline with the combined 
+            dependencies of the named components.
+    '''
+    comp = {'comp':ExtractFusedPipeline, 'easytext_dep':[], 'spacy_dep':[], 'pipearg_spacy_dep':dict(), 'pipearg_easytext_dep':dict()}
+    for name in names:
+        for key in ('easytext_dep','spacy_dep'):
+            comp[key] += [d for d in components[name][key] if d not in comp[key]]
+        for key in ('pipearg_spacy_dep','pipearg_easytext_dep'):
+            for arg, pdeps in components[name].get(key, dict()).items():
+                argdeps = comp[key].setdefault(arg, list())
+                argdeps += [d for d in pdeps if d not in argdeps]
+    return comp
+
+# lightweight spacy components that are not needed when another one is enabled
+#   (i.e. the rule-based sentence segmenter when the parser runs anyway)
+REDUNDANT_SPACY_COMPONENTS = {'sbd':'parser'}
+
+def get_spacy_deps(usepipes, components, pipeargs):
+    '''
+        Minimal set of spacy components needed to run usepipes, including
+            the spacy dependencies of their easytext dependencies.
+    '''
+    deps = set()
+    for pname in usepipes:
+        comp = components[pname]
+        deps |= set(component_deps(comp, 'spacy', pipeargs))
+        deps |= get_spacy_deps(component_deps(comp, 'easytext', pipeargs), components, pipeargs)
+    
+    for light, heavy in REDUNDANT_SPACY_COMPONENTS.items():
+        if heavy in deps:
+            deps.discard(light)
+    
+    return deps
+
 def recursive_add_component(add_component, components, nlp, pipeargs):
     '''
         Recursively adds pipelines to spacy nlp model, ensuring both spacy and easytext 
@@ -41,12 +109,12 @@ def recursive_add_component(add_component, components, nlp, pipeargs):
         comp = components[add_component]
 
         # add in other EasyText depenencies
-        for etdep in comp['easytext_dep']:
+        for etdep in component_deps(comp, 'easytext', pipeargs):
             if etdep not in nlp.pipe_names:
                 nlp = recursive_add_component(etdep, components, nlp, pipeargs)
 
         # add in spacy dependencies
-        for sdep in comp['spacy_dep']:
+        for sdep in component_deps(comp, 'spacy', pipeargs):
             if sdep not in nlp.pipe_names:
                 new_comp = nlp.create_pipe(sdep)
                 nlp.add_pipe(new_comp, last=True)
@@ -57,8 +125,176 @@ def recursive_add_component(add_component, components, nlp, pipeargs):
     return nlp
 
 # default args are consumed in pipeline components
-DEFAULT_PIPE_ARGS = dict(use_ents=False, use_ent_types=None, ignore_ent_types=None) # defaults that can be written over
-def easyparse(nlp,texts,enable=None, disable=None, pipeargs=dict(),spacyargs=dict()):
+DEFAULT_PIPE_ARGS = dict(use_ents=False, use_ent_types=None, ignore_ent_types=None, token_ids=False, entity_registry=None, prep_offsets=False, parse_nounphrases=True) # defaults that can be written over
+
+def get_usepipes(enable=None, disable=None):
+    '''
+        Decides which easytext components to activate from enable/disable lists.
+    '''
+    # choose which components to activate
+    if enable is not None:
+        usepipes = set(enable)
+    elif disable is not None:
+        usepipes = set(ALL_COMPONENTS.keys())
+        usepipes -= set(disable)
+    else:
+        usepipes = set(ALL_COMPONENTS.keys())
+    
+    # error check applied pipes
+    if not all([p in ALL_COMPONENTS.keys() for p in usepipes]):
+        raise Exception('Not all of', usepipes, 'are EasyText pipeline names.')
+    
+    return usepipes
+
+def build_pipeline(nlp, usepipes, pipeargs):
+    '''
+        Removes existing easytext components from nlp and adds the ones in
+            usepipes (with all their dependencies).
+    '''
+    # remove all existing pipe components
+    for pname in nlp.pipe_names:
+        if is_easytext_pipe(pname):
+            nlp.remove_pipe(pname)
+    
+    # token-level components are replaced by a single fused one
+    fused = [p for p in FUSED_COMPONENTS if p in usepipes]
+    components = PIPE_COMPONENTS
+    if len(fused) > 1:
+        components = {**PIPE_COMPONENTS, FUSED_NAME:fused_component(fused, PIPE_COMPONENTS)}
+        usepipes = (set(usepipes) - set(fused)) | {FUSED_NAME,}
+        pipeargs = {**pipeargs, 'fused_outputs':fused}
+    
+    # add all components, recursing through dependency trees
+    for pipename in sorted(usepipes):
+        nlp = recursive_add_component(pipename, components, nlp, pipeargs)
+    
+    return nlp
+
+def get_disabled_pipes(nlp, usepipes, pipeargs):
+    '''
+        Names of spacy components in nlp that none of usepipes need.
+    '''
+    deps = get_spacy_deps(usepipes, PIPE_COMPONENTS, pipeargs)
+    return [p for p in nlp.pipe_names if not is_easytext_pipe(p) and p not in deps]
+
+def add_disabled_pipes(nlp, usepipes, pipeargs, spacyargs):
+    '''
+        Adds unneeded spacy components to the 'disable' argument of spacy.pipe().
+    '''
+    disable = set(spacyargs.get('disable', list())) | set(get_disabled_pipes(nlp, usepipes, pipeargs))
+    return {**spacyargs, 'disable':sorted(disable)}
+
+def get_model_name(nlp):
+    '''
+        Name or path that can be passed to spacy.load() to reload nlp in 
+            another process.
+    '''
+    if isinstance(nlp, str):
+        return nlp
+    if getattr(nlp, 'path', None) is not None:
+        return str(nlp.path)
+    return '{}_{}'.format(nlp.meta['lang'], nlp.meta['name'])
+
+def detach_easytext(dat):
+    '''
+        Copies the EasyTextRecord of a doc so it can be sent between processes
+            (or stored). 'entids' are dropped because they refer to the 
+            worker's EntityRegistry (see canonicalize_entities()).
+    '''
+    return EasyTextRecord.from_items((k,v) for k,v in dat.items() if k != 'entids')
+
+def canonicalize_entities(dat, registry):
+    '''
+        Registers the entities of detached easytext data in registry and 
+            sets their 'entids'. When applied to documents in input order, 
+            this gives the same ids as ExtractEntListPipeline in a serial run.
+    '''
+    if 'entlist' in dat:
+        dat['entids'] = [registry.add(etext) for etext in dat['entlist']]
+    return dat
+
+# state for worker processes in parallel easyparse (set by _init_worker)
+_WORKER = dict()
+
+def _init_worker(model, load_disable, usepipes, pipeargs, spacyargs):
+    nlp = spacy.load(model, disable=load_disable)
+    nlp = build_pipeline(nlp, usepipes, pipeargs)
+    _WORKER['nlp'] = nlp
+    _WORKER['spacyargs'] = add_disabled_pipes(nlp, usepipes, pipeargs, spacyargs)
+
+def _parse_chunk(texts):
+    nlp = _WORKER['nlp']
+    return [detach_easytext(doc._.easytext) for doc in nlp.pipe(texts, **_WORKER['spacyargs'])]
+
+def chunk_iter(items, chunk_size):
+    '''
+        Groups an iterable into lists of at most chunk_size items.
+    '''
+    chunk = list()
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = list()
+    if len(chunk) > 0:
+        yield chunk
+
+def parallel_parse(nlp, texts, usepipes, pipeargs, spacyargs, n_process, chunk_size):
+    '''
+        Parses chunks of texts in n_process worker processes, each of which 
+            loads the spacy model and easytext pipeline once. Yields detached 
+            easytext data in input order. At most 2*n_process chunks are in 
+            flight at once, so texts can be an arbitrarily long generator.
+    '''
+    initargs = (get_model_name(nlp), get_disabled_pipes(nlp, usepipes, pipeargs), usepipes, pipeargs, spacyargs)
+    with multiprocessing.Pool(n_process, initializer=_init_worker, initargs=initargs) as pool:
+        pending = deque()
+        for chunk in chunk_iter(texts, chunk_size):
+            pending.append(pool.apply_async(_parse_chunk, (chunk,)))
+            if len(pending) >= 2*n_process:
+                yield from pending.popleft().get()
+        while len(pending) > 0:
+            yield from pending.popleft().get()
+
+def cached_parse(nlp, texts, cache, usepipes, pipeargs, spacyargs, n_process, chunk_size):
+    '''
+        Looks up chunks of texts in a ParseCache and parses only the missing 
+            ones (in n_process worker processes if n_process > 1). Yields 
+            detached easytext data in input order.
+    '''
+    spacy_pipes = get_spacy_deps(usepipes, PIPE_COMPONENTS, pipeargs)
+    config = cache.make_config(nlp, usepipes, pipeargs, spacy_pipes)
+    
+    pool = None
+    if n_process > 1:
+        initargs = (get_model_name(nlp), get_disabled_pipes(nlp, usepipes, pipeargs), usepipes, pipeargs, spacyargs)
+        pool = multiprocessing.Pool(n_process, initializer=_init_worker, initargs=initargs)
+        parse = lambda ts: [d for ds in pool.map(_parse_chunk, chunk_iter(ts, chunk_size)) for d in ds]
+    else:
+        nlp = build_pipeline(nlp, usepipes, pipeargs)
+        spacyargs = add_disabled_pipes(nlp, usepipes, pipeargs, spacyargs)
+        parse = lambda ts: [detach_easytext(doc._.easytext) for doc in nlp.pipe(ts, **spacyargs)]
+    
+    try:
+        for chunk in chunk_iter(texts, chunk_size*n_process):
+            keys = [cache.make_key(t, config) for t in chunk]
+            dats = [EasyTextRecord.from_items(d.items()) if d is not None else None for d in cache.get_many(keys)]
+            
+            # parse only texts missing from cache
+            misstexts = [t for t,d in zip(chunk,dats) if d is None]
+            if len(misstexts) > 0:
+                parsed = parse(misstexts)
+                missing = [i for i,d in enumerate(dats) if d is None]
+                for i,dat in zip(missing, parsed):
+                    dats[i] = dat
+                cache.put_many([(keys[i],dats[i].to_dict()) for i in missing]) # plain dicts
+            
+            yield from dats
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def easyparse(nlp, texts, enable=None, disable=None, pipeargs=dict(), spacyargs=dict(), n_process=1, batch_size=None, chunk_size=1000, cache=None):
     '''
         Runs spacy parser loop only extracting data from enabled custom modules.
         
@@ -81,34 +317,47 @@ def easyparse(nlp,texts,enable=None, disable=None, pipeargs=dict(),spacyargs=dic
                 are listed in the DEFAULT_PIPE_ARGS found above this fuction 
                 definition.
             spacyargs: Arguments that, when unpacked, will be pased directly to 
-                the spacy.pipe() method.
+                the spacy.pipe() method. Spacy components that are not needed 
+                by the enabled easytext components (see get_spacy_deps()) are 
+                added to spacyargs['disable'].
+            n_process: number of worker processes. If greater than 1, each worker
+                loads the spacy model again (see get_model_name()) and parses 
+                chunks of texts. Outputs are returned in input order. Entity 
+                ids are assigned in input order by the parent process (using
+                pipeargs['entity_registry'] if given) so they match a serial
+                run.
+            batch_size: batch size passed to spacy.pipe().
+            chunk_size: number of texts sent to a worker process at a time.
+            cache: ParseCache object. Documents found in the cache are not 
+                parsed again, and newly parsed ones are added to it. As with 
+                n_process > 1, outputs are detached from spacy docs.
             
     '''
     pipeargs = {**DEFAULT_PIPE_ARGS, **pipeargs} # allows user to override defaults
+    if batch_size is not None:
+        spacyargs = {**spacyargs, 'batch_size':batch_size}
     
-    # remove all existing pipe components
-    for pname in nlp.pipe_names:
-        if pname in ALL_COMPONENTS.keys():
-            nlp.remove_pipe(pname)
-    
-    # choose which components to activate
-    if enable is not None:
-        usepipes = set(enable)
-    elif disable is not None:
-        usepipes = list(ALL_COMPONENTS.keys())
-        usepipes -= set(disable)
-    else:
-        usepipes = set(ALL_COMPONENTS.keys())
-    
-    # error check applied pipes
-    if not all([p in ALL_COMPONENTS.keys() for p in usepipes]):
-        raise Exception('Not all of', usepipes, 'are EasyText pipeline names.')
+    usepipes = get_usepipes(enable, disable)
+    if pipeargs['entity_registry'] is None:
+        pipeargs['entity_registry'] = EntityRegistry()
     
-    # add all components, recursing through dependency trees
-    for pipename in usepipes:
-        nlp = recursive_add_component(pipename, ALL_COMPONENTS, nlp, pipeargs)
+    if n_process > 1 or cache is not None:
+        # workers don't register entities, the parent does in input order
+        #   (see canonicalize_entities())
+        workerargs = {**pipeargs, 'entity_registry':None}
+        if cache is not None:
+            parsed = cached_parse(nlp, texts, cache, usepipes, workerargs, spacyargs, n_process, chunk_size)
+        else:
+            parsed = parallel_parse(nlp, texts, usepipes, workerargs, spacyargs, n_process, chunk_size)
+        
+        for dat in parsed:
+            yield canonicalize_entities(dat, pipeargs['entity_registry'])
     
-    # extracts only easytext data from docs as generator
-    for doc in nlp.pipe(texts, **spacyargs):
-        dat = doc._.easytext
-        yield dat
+    else:
+        nlp = build_pipeline(nlp, usepipes, pipeargs)
+        spacyargs = add_disabled_pipes(nlp, usepipes, pipeargs, spacyargs)
+        
+        # extracts only easytext data from docs as generator
+        for doc in nlp.pipe(texts, **spacyargs):
+            dat = doc._.easytext
+            yield dat
@@ -1,5 +1,6 @@
 
 import os.path
+import glob
 import pandas as pd
 
 
@@ -27,15 +28,101 @@ def read_text_file(fname):
     return text
 
 
-def read_input_files(infiles,doclabelcol,textcol):
+def expand_infiles(infiles):
     '''
-        Reads single or multiple text files or an excel/csv file.
+        Expands glob patterns in input file names (shells usually do this, 
+            but quoted patterns avoid command line length limits).
+    '''
+    fnames = list()
+    for fn in infiles:
+        if glob.has_magic(fn):
+            fnames += sorted(glob.glob(fn))
+        else:
+            fnames.append(fn)
+    return fnames
+
+def iter_text_lines(fname):
+    '''
+        Lazily yields (line number, line) of non-empty lines of a text file.
+    '''
+    with open(fname, 'rb') as f:
+        for i,line in enumerate(f):
+            text = line.decode('ascii',errors='ignore')
+            if text.endswith('\n'):
+                text = text[:-1]
+            if len(text) > 0:
+                yield i, text
+
+def iter_spreadsheet_rows(fname, columns, chunksize=10000):
     '''
+        Lazily yields rows (as dicts of the given column names) of a csv 
+            or excel file. Csv files are read in chunks of chunksize rows, 
+            and xlsx files are read row by row in openpyxl read-only mode.
+    '''
+    fext = os.path.splitext(os.path.basename(fname))[1]
+    readerror = 'There was a problem reading the {} file.'.format(fext)
+    
+    try:
+        if fext == '.csv':
+            chunks = pd.read_csv(fname, chunksize=chunksize)
+        elif fext == '.xlsx':
+            import openpyxl
+            wb = openpyxl.load_workbook(fname, read_only=True)
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            header = [str(c) for c in next(rows)]
+        elif fext == '.xls':
+            chunks = [pd.read_excel(fname),] # no streaming reader for old excel files
+    except:
+        raise Exception(readerror)
+    
+    if fext == '.xlsx':
+        for col in columns:
+            if col not in header:
+                raise Exception('The column name was not found in spreadsheet:', col)
+        inds = [header.index(col) for col in columns]
+        for row in iter_or_raise(rows, readerror):
+            # empty cells are None in openpyxl
+            yield {col:('' if row[i] is None else row[i]) for col,i in zip(columns,inds)}
+        wb.close()
+    
+    else:
+        # csv chunks are only parsed as they are iterated
+        for df in iter_or_raise(chunks, readerror):
+            for col in columns:
+                if col not in df.columns:
+                    raise Exception('The column name was not found in spreadsheet:', col)
+            for vals in zip(*[df[col] for col in columns]):
+                yield dict(zip(columns,vals))
+
+def iter_or_raise(items, message):
+    '''
+        Iterates items, raising Exception(message) if reading an item fails.
+    '''
+    items = iter(items)
+    while True:
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        except:
+            raise Exception(message)
+        yield item
+
+def iter_input_files(infiles, doclabelcol, textcol, chunksize=10000):
+    '''
+        Lazily yields (docname, text) pairs from single or multiple text 
+            files or an excel/csv file. Only one document (or one chunk of
+            spreadsheet rows) is held in memory at a time.
+    '''
+    infiles = expand_infiles(infiles)
+    if len(infiles) == 0:
+        raise Exception('No input files were found.')
     
     # read multiple text files
     if len(infiles) > 1:
-        texts = [read_text_file(fn) for fn in infiles]
         docnames = filenames_to_docnames(infiles)
+        for docname, fn in zip(docnames, infiles):
+            yield docname, read_text_file(fn)
     
     else:
         fname = infiles[0]
@@ -43,36 +130,56 @@ def read_input_files(infiles,doclabelcol,textcol):
         
         # read single text file
         if fext == '.txt':
-            text = read_text_file(fname)
-            textnames = [(i,t) for i,t in enumerate(text.split('\n')) if len(t) > 0]
-            docnames = [str(i) for i,t in textnames]
-            texts = [t for i,t in textnames]
-            
-        # read spreadsheet file using pandas
+            for i,text in iter_text_lines(fname):
+                yield str(i), text
+        
+        # read spreadsheet file
         elif fext in ('.xlsx','.xls','.csv',):
-            try:
-                if fext == '.csv':
-                    df = pd.read_csv(fname)
-                elif fext in ('.xlsx','.xls'):
-                    df = pd.read_excel(fname)
-            except:
-                raise Exception('There was a problem reading the {} file.'.format(fext))
-                
-            # perform checks on column names
-            if textcol not in df.columns:
-                raise Exception('The text column name was not found in spreadsheet:', textcol)
-            if doclabelcol is not None and doclabelcol not in df.columns:
-                raise Exception('The column name for document labels was not found in the spreadsheet:', doclabelcol)
-                
-            # extract texts and doclabels
-            texts = [str(v) for v in df[textcol]]
-            if doclabelcol is not None:
-                docnames = [str(n) for n in df[doclabelcol]]
-            else:
-                docnames = [str(i) for i in range(df.shape[0])]
-
+            columns = [textcol,] if doclabelcol is None else [textcol,doclabelcol]
+            for i,row in enumerate(iter_spreadsheet_rows(fname, columns, chunksize)):
+                docname = str(i) if doclabelcol is None else str(row[doclabelcol])
+                yield docname, str(row[textcol])
+        
         else:
             raise Exception('You need to pass an xls or 1+ txt files.')
-            
-    return texts, docnames
 
+class DocStream:
+    '''
+        Re-iterable stream of texts read lazily from input files (see 
+            iter_input_files()), so the corpus never needs to fit in memory.
+            Each iteration reads the files again. Document names are 
+            appended to the docnames list during the first full pass, so
+            it can be passed along with the stream before parsing starts.
+    '''
+    def __init__(self, infiles, doclabelcol, textcol, chunksize=10000):
+        self.infiles = infiles
+        self.doclabelcol = doclabelcol
+        self.textcol = textcol
+        self.chunksize = chunksize
+        self.docnames = list()
+        self.complete = False
+    
+    def __iter__(self):
+        record = not self.complete
+        if record:
+            del self.docnames[:] # restart an unfinished first pass
+        for docname, text in iter_input_files(self.infiles, self.doclabelcol, self.textcol, self.chunksize):
+            if record:
+                self.docnames.append(docname)
+            yield text
+        
+        if record:
+            self.complete = True
+            if len(self.docnames) == 0:
+                raise Exception('No documents were found in the input files.')
+
+def read_input_files(infiles,doclabelcol,textcol):
+    '''
+        Reads single or multiple text files or an excel/csv file.
+    '''
+    docnames, texts = list(), list()
+    for docname, text in iter_input_files(infiles, doclabelcol, textcol):
+        docnames.append(docname)
+        texts.append(text)
+    
+    return texts, docnames
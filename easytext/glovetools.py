@@ -2,7 +2,11 @@
 from glove.glove_cython import fit_vectors, transform_paragraph
 import collections
 import numpy as np
+import scipy.sparse
 import numbers
+import multiprocessing
+
+from .reports import top_k_indices
 
 
 def glove_vector(gm,word):
@@ -17,6 +21,29 @@ def glove_projection(gm, tword, pvec):
     prod = pvec.dot(tvec)/(np.linalg.norm(tvec) * np.linalg.norm(pvec))
     return prod
 
+def dimension_words(word_vectors, topn=None):
+    '''
+        Projection of each normalized word vector onto each embedding 
+            dimension (same values as glove_projection() with natural 
+            basis vectors), computed as one matrix operation.
+        Output: <n_dim x n_words> array, or scipy csr_matrix keeping only
+            the topn largest values of each dimension if topn is given.
+        Inputs:
+            word_vectors: <n_words x n_dim> array of word vectors.
+            topn: number of words to keep for each dimension.
+    '''
+    word_vectors = np.asarray(word_vectors, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dimwords = (word_vectors / np.linalg.norm(word_vectors, axis=1)[:,np.newaxis]).T
+    
+    if topn is None or topn >= dimwords.shape[1]:
+        return dimwords
+    
+    cols = top_k_indices(dimwords, topn)
+    rows = np.repeat(np.arange(dimwords.shape[0]), cols.shape[1])
+    vals = np.take_along_axis(dimwords, cols, axis=1).ravel()
+    return scipy.sparse.csr_matrix((vals, (rows, cols.ravel())), shape=dimwords.shape)
+
 def glove_rejection(x,v):
     '''
         Return part of x that is orthogonal to v.
@@ -27,45 +54,186 @@ def glove_rejection(x,v):
     return x - x.dot(v)/(nx*nv)*v
 
 
-def supervised_vectors(gm, keywords=list()):
+def cooccurrence_block(ids, sentids, n_words, window=10):
     '''
-        Performs a hyper-rotation of the vector space according to 
-        pre-defined topical words. Can work like a kind of supervised topic modeling.
+        Cooccurrence matrix of one block of whole sentences (see 
+            cooccurrence_matrix()).
+        Output: <n_words x n_words> scipy csr_matrix.
     '''
-    n_dim = gm.word_vectors[0].shape[0]
-    assert(len(keywords) <= n_dim and len(keywords) > 0)
-    assert(all([w in gm.dictionary.keys() for kw in keywords for w in kw]))
+    rows, cols, vals = list(), list(), list()
+    for d in range(1,window+1):
+        a, b = ids[:-d], ids[d:]
+        valid = (sentids[:-d] == sentids[d:]) & (a != b) & (a >= 0) & (b >= 0) & (a < n_words) & (b < n_words)
+        rows.append(np.minimum(a,b)[valid])
+        cols.append(np.maximum(a,b)[valid])
+        vals.append(np.full(valid.sum(), 1.0/d))
     
-    # form basis axes for each 
-    newbasis = list()
-    for kw in keywords:
-        v = glove_vectors(gm, kw)
-        
-        # create as orthogonal to all other keywords
-        for bv in newbasis:
-            v = glove_rejection(v,bv)
+    return scipy.sparse.coo_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_words,n_words),
+    ).tocsr()
+
+def to_glove_coo(matrix):
+    '''
+        Converts matrix to the coo format expected by Glove.fit().
+    '''
+    matrix = matrix.tocoo()
+    return scipy.sparse.coo_matrix(
+        (matrix.data.astype(np.float64), (matrix.row.astype(np.int32), matrix.col.astype(np.int32))),
+        shape=matrix.shape,
+    )
+
+def cooccurrence_matrix(ids, sent_indptr, n_words, window=10, block_size=1000000, n_process=1):
+    '''
+        Builds the upper-triangular word cooccurrence matrix used by Glove, 
+            with the same weighting as glove.Corpus.fit(): words within window 
+            positions of each other in a sentence add 1/distance, and 
+            cooccurrences of a word with itself are ignored. Works on 
+            blocks of whole sentences at a time to bound memory.
+        Ids outside [0,n_words) (i.e. words below a min_tf cutoff) still 
+            take up positions in sentences but are not counted, so the 
+            matrix only ever has rows and columns for kept words.
+        Output: <n_words x n_words> scipy coo_matrix.
+        Inputs:
+            ids: int array of word ids of all sentences end to end.
+            sent_indptr: sentence i covers ids[sent_indptr[i]:sent_indptr[i+1]].
+            n_words: number of words in dictionary.
+            window: max distance between cooccurring words.
+            block_size: approximate number of tokens processed at once.
+            n_process: number of worker processes, each accumulating the
+                matrix of a shard of sentences. Shards are summed at the end.
+    '''
+    builder = CooccurrenceBuilder(n_words, window=window, block_size=block_size)
+    if n_process > 1:
+        sent_indptr = np.asarray(sent_indptr)
+        bounds = np.linspace(0, len(sent_indptr)-1, n_process+1).astype(np.int64)
+        shards = [(bounds[i], bounds[i+1]) for i in range(n_process) if bounds[i] < bounds[i+1]]
         
-        # add as basis unit vector
-        newbasis.append(v/np.linalg.norm(v))
+        initargs = (np.asarray(ids), sent_indptr, n_words, window, block_size)
+        with multiprocessing.Pool(n_process, initializer=_init_cooc_worker, initargs=initargs) as pool:
+            for shard in pool.starmap(_cooc_shard, shards):
+                builder.merge(shard)
+    else:
+        builder.add_corpus(ids, sent_indptr)
     
-    # Now create random new vectors which are orthogonal to 
-    #   each other and the previous basis.
-    for j in range(len(keywords),n_dim):
-        v = np.random.rand(n_dim)
+    return builder.tocoo()
+
+class CooccurrenceBuilder:
+    '''
+        Accumulates a Glove cooccurrence matrix (see cooccurrence_matrix()) 
+            from a stream of sentences of word ids, in a sparse buffer of 
+            only n_words x n_words. Sentences are buffered and counted in 
+            blocks of about block_size tokens. Builders of different shards
+            of a corpus can be combined with merge().
+    '''
+    def __init__(self, n_words, window=10, block_size=1000000):
+        self.n_words = n_words
+        self.window = window
+        self.block_size = block_size
+        self.matrix = scipy.sparse.csr_matrix((n_words,n_words), dtype=np.float64)
         
-        # make orthogonal to previous basis vectors
-        for bv in newbasis:
-            v = glove_rejection(v,bv)
+        self._sents = list()
+        self._ntokens = 0
+    
+    def add_sent(self, ids):
+        '''
+            Adds one sentence as an array of word ids. Ids outside 
+                [0,n_words) hold positions but are not counted.
+        '''
+        self._sents.append(np.asarray(ids, dtype=np.int64))
+        self._ntokens += len(ids)
+        if self._ntokens >= self.block_size:
+            self.flush()
+    
+    def add_corpus(self, ids, sent_indptr):
+        '''
+            Adds all sentences in CSR layout (ids of sentence i are 
+                ids[sent_indptr[i]:sent_indptr[i+1]]) block by block.
+        '''
+        self.flush()
+        ids = np.asarray(ids)
+        sent_indptr = np.asarray(sent_indptr)
+        sentids = np.repeat(np.arange(len(sent_indptr)-1), np.diff(sent_indptr))
         
-        # add as basis unit vector
-        newbasis.append(v/np.linalg.norm(v))
+        blockstarts = np.searchsorted(sent_indptr, np.arange(sent_indptr[0],sent_indptr[-1],self.block_size))
+        blockbounds = list(sent_indptr[blockstarts]) + [sent_indptr[-1],]
+        for start, end in zip(blockbounds[:-1], blockbounds[1:]):
+            self.matrix = self.matrix + cooccurrence_block(ids[start:end], sentids[start-sent_indptr[0]:end-sent_indptr[0]], self.n_words, self.window)
+    
+    def flush(self):
+        if len(self._sents) > 0:
+            ids = np.concatenate(self._sents)
+            sentids = np.repeat(np.arange(len(self._sents)), [len(s) for s in self._sents])
+            self.matrix = self.matrix + cooccurrence_block(ids, sentids, self.n_words, self.window)
+            self._sents = list()
+            self._ntokens = 0
+    
+    def merge(self, other):
+        '''
+            Adds counts of another CooccurrenceBuilder or sparse matrix.
+        '''
+        if isinstance(other, CooccurrenceBuilder):
+            other.flush()
+            other = other.matrix
+        self.flush()
+        self.matrix = self.matrix + other
+        return self
+    
+    def tocoo(self):
+        self.flush()
+        return to_glove_coo(self.matrix)
+
+_COOC = dict()
+
+def _init_cooc_worker(ids, sent_indptr, n_words, window, block_size):
+    _COOC.update(ids=ids, sent_indptr=sent_indptr, n_words=n_words, window=window, block_size=block_size)
+
+def _cooc_shard(start_sent, end_sent):
+    builder = CooccurrenceBuilder(_COOC['n_words'], window=_COOC['window'], block_size=_COOC['block_size'])
+    builder.add_corpus(_COOC['ids'], _COOC['sent_indptr'][start_sent:end_sent+1])
+    return builder.matrix
+
+def keyword_basis(gm, keywords):
+    '''
+        Orthonormal basis whose first vectors point along the summed vectors
+            of each keyword group (each orthogonal to the ones before it, as
+            in Gram-Schmidt) and whose remaining vectors are random, seeded
+            from gm.random_state. Computed with a QR decomposition.
+        Output: <n_dim x n_dim> array with basis vectors as rows.
+    '''
+    n_dim = gm.word_vectors.shape[1]
+    kwvecs = np.vstack([glove_vectors(gm, kw) for kw in keywords])
+    
+    random_state = check_random_state(gm.random_state)
+    fill = random_state.rand(n_dim-len(keywords), n_dim)
     
-    # B is now linear transformation from old basis to new one
-    B = np.vstack(newbasis)
+    Q, R = np.linalg.qr(np.vstack([kwvecs, fill]).T)
+    diag = np.diag(R)
+    if np.any(np.abs(diag[:len(keywords)]) <= 1e-10 * np.linalg.norm(kwvecs, axis=1)):
+        raise Exception('Keyword groups are linearly dependent, so they can\'t form separate dimensions.')
+    
+    # flip signs so basis vectors point along (not against) keyword vectors
+    signs = np.where(diag < 0, -1.0, 1.0)
+    return (Q * signs).T
+
+def supervised_vectors(gm, keywords=list(), chunk_size=100000):
+    '''
+        Performs a hyper-rotation of the vector space according to 
+        pre-defined topical words. Can work like a kind of supervised topic modeling.
+        Word vectors are rotated in place, chunk_size rows at a time.
+    '''
+    n_dim = gm.word_vectors.shape[1]
+    assert(len(keywords) <= n_dim and len(keywords) > 0)
+    assert(all([w in gm.dictionary.keys() for kw in keywords for w in kw]))
+    
+    # B is linear transformation from old basis to new one
+    B = keyword_basis(gm, keywords)
     
     # now modify glove vectors to match transformed basis
-    for i in range(len(gm.dictionary)):
-        gm.word_vectors[i] = B.dot(gm.word_vectors[i])
+    n_words = len(gm.dictionary)
+    for start in range(0, n_words, chunk_size):
+        end = min(start+chunk_size, n_words)
+        gm.word_vectors[start:end] = gm.word_vectors[start:end] @ B.T
     
     return gm
     
@@ -74,6 +242,99 @@ def supervised_vectors(gm, keywords=list()):
 
 
 
+def tfidf_mean_vectors(word_vectors, counts):
+    '''
+        Cheap approximation of paragraph vectors: the tf-idf weighted mean
+            of the vectors of the words in each document.
+        Output: <Ndocs x n_dim> array (NaN rows for documents without 
+            any vocabulary words, as with glove_transform_paragraph).
+        Inputs:
+            word_vectors: <n_words x n_dim> array of word vectors.
+            counts: sparse <Ndocs x n_words> matrix of token counts.
+    '''
+    counts = scipy.sparse.csr_matrix(counts, dtype=np.float64)
+    docfreq = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = np.log((1 + counts.shape[0]) / (1 + docfreq)) + 1 # as in sklearn TfidfTransformer
+    weights = counts @ scipy.sparse.diags(idf)
+    
+    totals = np.asarray(weights.sum(axis=1)).ravel()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (weights @ word_vectors) / totals[:,np.newaxis]
+
+def paragraph_vectors(gm, counts, epochs=50, n_process=1, chunk_size=1000):
+    '''
+        Batched version of glove_transform_paragraph() that fits the
+            vectors of all documents from a sparse matrix of counts. Each
+            document is fit with the same cython routine and seed as
+            glove_transform_paragraph(gm, doc, ignore_missing=True), but 
+            without building per-document dictionaries (words are visited
+            in the column order of each row rather than first appearance,
+            so results differ by SGD noise).
+        Output: <Ndocs x n_dim> array.
+        Inputs:
+            gm: fitted glove model.
+            counts: sparse <Ndocs x n_words> matrix of token counts, where
+                columns are ids in gm.dictionary.
+            epochs: training epochs for each document.
+            n_process: number of worker processes. Each receives the word
+                vectors and biases once and fits chunks of documents.
+            chunk_size: number of documents per worker task.
+    '''
+    if gm.word_vectors is None:
+        raise Exception('Model must be fit to transform paragraphs')
+    
+    counts = scipy.sparse.csr_matrix(counts, dtype=np.float64)
+    chunks = [counts[start:start+chunk_size] for start in range(0, counts.shape[0], chunk_size)]
+    if len(chunks) == 0:
+        return np.empty((0, gm.word_vectors.shape[1]), dtype=np.float64)
+    
+    initargs = (gm.word_vectors, gm.word_biases, gm.random_state, gm.learning_rate, gm.max_count, gm.alpha, epochs)
+    if n_process > 1:
+        with multiprocessing.Pool(n_process, initializer=_init_paragraph_worker, initargs=initargs) as pool:
+            return np.vstack(pool.map(_fit_paragraphs, chunks))
+    else:
+        _init_paragraph_worker(*initargs)
+        try:
+            return np.vstack([_fit_paragraphs(chunk) for chunk in chunks])
+        finally:
+            _PARAGRAPH.clear()
+
+_PARAGRAPH = dict()
+
+def _init_paragraph_worker(word_vectors, word_biases, random_state, learning_rate, max_count, alpha, epochs):
+    _PARAGRAPH.update(word_vectors=word_vectors, word_biases=word_biases, random_state=random_state, 
+        learning_rate=learning_rate, max_count=max_count, alpha=alpha, epochs=epochs)
+
+def _fit_paragraphs(counts):
+    word_vectors, max_count = _PARAGRAPH['word_vectors'], _PARAGRAPH['max_count']
+    docvectors = np.empty((counts.shape[0], word_vectors.shape[1]), dtype=np.float64)
+    for i in range(counts.shape[0]):
+        word_ids = counts.indices[counts.indptr[i]:counts.indptr[i+1]].astype(np.int32)
+        values = counts.data[counts.indptr[i]:counts.indptr[i+1]] * (max_count / 10.0)
+        shuffle_indices = np.arange(len(word_ids), dtype=np.int32)
+        
+        # Initialize the vector to mean of constituent word vectors
+        with np.errstate(invalid='ignore'):
+            paragraph_vector = np.mean(word_vectors[word_ids], axis=0)
+        sum_gradients = np.ones_like(paragraph_vector)
+        
+        # seeded per document to match glove_transform_paragraph
+        check_random_state(_PARAGRAPH['random_state']).shuffle(shuffle_indices)
+        transform_paragraph(word_vectors,
+                            _PARAGRAPH['word_biases'],
+                            paragraph_vector,
+                            sum_gradients,
+                            word_ids,
+                            values,
+                            shuffle_indices,
+                            _PARAGRAPH['learning_rate'],
+                            max_count,
+                            _PARAGRAPH['alpha'],
+                            _PARAGRAPH['epochs'])
+        docvectors[i] = paragraph_vector
+    
+    return docvectors
+
 # VVVVVVVVVVVVVVVVVV These were taken with minor corrections from the glove library. VVVVVVVVVVVVVVVVVV
 # see original file: https://github.com/maciejkula/glove-python/blob/master/glove/glove.py
 
@@ -0,0 +1,241 @@
+import os
+import os.path
+import json
+import pickle
+import numpy as np
+import pandas as pd
+
+from .reports import top_k_indices
+
+
+def normalize_rows(vectors):
+    '''
+        Unit-length copy of each row (rows of zeros or NaN become NaN, so
+            they are never returned as neighbours).
+    '''
+    vectors = np.asarray(vectors, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return vectors / np.linalg.norm(vectors, axis=1)[:,np.newaxis]
+
+def spherical_kmeans(vectors, n_clusters, n_iter=10, sample_size=100000, random_state=0):
+    '''
+        Clusters unit-length vectors by cosine similarity (used for the ivf
+            index). Centroids are trained on a random sample of rows.
+        Output: <n_clusters x n_dim> array of unit-length centroids.
+    '''
+    rs = np.random.RandomState(random_state)
+    valid = np.flatnonzero(~np.isnan(vectors).any(axis=1))
+    sample = vectors[rs.choice(valid, min(sample_size, len(valid)), replace=False)]
+    centroids = sample[rs.choice(len(sample), n_clusters, replace=False)]
+
+    for it in range(n_iter):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+
+        # keep old centroids of empty clusters
+        empty = np.bincount(assign, minlength=n_clusters) == 0
+        sums[empty] = centroids[empty]
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+class VectorIndex:
+    '''
+        Cosine-similarity nearest-neighbour index over a set of named
+            vectors (i.e. word or document vectors of a DocModel).
+        In 'exact' mode, queries are scored against all vectors using
+            blocked matrix multiplies. In 'ivf' mode, vectors are grouped
+            into n_clusters clusters by spherical k-means and only the
+            n_probe clusters closest to each query are scored, which is
+            much faster for large vocabularies but may miss neighbours.
+    '''
+    def __init__(self, vectors, names, mode='exact', n_clusters=None, n_probe=8, block_size=10000, random_state=0):
+        '''
+            Inputs:
+                vectors: <N x n_dim> array of vectors.
+                names: list of N names (i.e. words or docnames).
+                mode: 'exact' or 'ivf'.
+                n_clusters: number of ivf clusters (default sqrt(N)).
+                n_probe: number of clusters scored per query in ivf mode.
+                block_size: number of vectors scored at once.
+                random_state: seed for ivf clustering.
+        '''
+        if mode not in ('exact','ivf'):
+            raise Exception('VectorIndex mode should be "exact" or "ivf", not {}.'.format(mode))
+
+        self.vectors = normalize_rows(vectors)
+        self.names = pd.Index(names)
+        self.mode = mode
+        self.n_probe = n_probe
+        self.block_size = block_size
+
+        self.centroids = None
+        self.list_indptr = None
+        self.list_ids = None
+        if mode == 'ivf':
+            if n_clusters is None:
+                n_clusters = max(1, int(np.sqrt(len(self.names))))
+            self.centroids = spherical_kmeans(self.vectors, n_clusters, random_state=random_state)
+            self.set_lists(self.assign(self.vectors))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return '<VectorIndex {} vectors, mode={}>'.format(len(self), self.mode)
+
+    def assign(self, vectors):
+        '''
+            Closest centroid to each vector (-1 for NaN vectors).
+        '''
+        sims = np.nan_to_num(vectors @ self.centroids.T, nan=-np.inf)
+        assign = np.argmax(sims, axis=1)
+        assign[np.isnan(vectors).any(axis=1)] = -1
+        return assign
+
+    def set_lists(self, assign):
+        '''
+            Stores the vector ids of each cluster in CSR layout.
+        '''
+        keep = np.flatnonzero(assign >= 0)
+        order = keep[np.argsort(assign[keep], kind='stable')]
+        self.list_ids = order
+        self.list_indptr = np.concatenate([[0,],np.cumsum(np.bincount(assign[keep], minlength=len(self.centroids)))])
+
+    # ________ Queries _________
+    def get_vector(self, name):
+        return self.vectors[self.names.get_loc(name)]
+
+    def query(self, vectors, topn=10, exclude=None):
+        '''
+            Finds the most similar vectors for a batch of query vectors.
+            Output: (ids, scores) tuple of <Nq x topn> arrays, ordered by
+                descending cosine similarity. Rows with fewer candidates
+                (ivf mode) are padded with id -1 and score NaN.
+            Inputs:
+                vectors: <Nq x n_dim> array of query vectors.
+                topn: number of neighbours to return.
+                exclude: optional list of one index id per query to leave
+                    out of its results (i.e. the query itself).
+        '''
+        queries = normalize_rows(np.atleast_2d(vectors))
+        if self.mode == 'exact':
+            ids, scores = self.query_exact(queries, topn+1)
+        else:
+            ids, scores = self.query_ivf(queries, topn+1)
+
+        # drop excluded ids (one extra neighbour was retrieved)
+        if exclude is not None:
+            drop = ids == np.asarray(exclude)[:,np.newaxis]
+            scores = np.where(drop, np.nan, scores)
+            ids = np.where(drop, -1, ids)
+        order = top_k_indices(scores, topn)
+        ids, scores = np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+        ids[np.isnan(scores)] = -1
+        return ids, scores
+
+    def query_exact(self, queries, topn):
+        '''
+            Scores queries against all vectors, block_size vectors at a
+                time, keeping the running topn of each query (NaN scores
+                of NaN vectors are ranked last).
+        '''
+        best_ids = np.zeros((len(queries),0), dtype=np.int64)
+        best_scores = np.zeros((len(queries),0))
+        for start in range(0, len(self), self.block_size):
+            block = queries @ self.vectors[start:start+self.block_size].T
+
+            cand_ids = np.hstack([best_ids, np.broadcast_to(np.arange(start, start+block.shape[1]), block.shape)])
+            cand_scores = np.hstack([best_scores, block])
+            order = top_k_indices(cand_scores, topn)
+            best_ids = np.take_along_axis(cand_ids, order, axis=1)
+            best_scores = np.take_along_axis(cand_scores, order, axis=1)
+
+        return best_ids, best_scores
+
+    def query_ivf(self, queries, topn):
+        '''
+            Scores each query against the vectors of its n_probe closest
+                clusters.
+        '''
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = top_k_indices(np.nan_to_num(queries @ self.centroids.T, nan=-np.inf), n_probe)
+
+        ids = np.full((len(queries),topn), -1, dtype=np.int64)
+        scores = np.full((len(queries),topn), np.nan)
+        for i in range(len(queries)):
+            cand = np.concatenate([self.list_ids[self.list_indptr[c]:self.list_indptr[c+1]] for c in probes[i]])
+            if len(cand) == 0:
+                continue
+            sims = self.vectors[cand] @ queries[i]
+            order = top_k_indices(sims[np.newaxis,:], topn)[0]
+            ids[i,:len(order)] = cand[order]
+            scores[i,:len(order)] = sims[order]
+
+        return ids, scores
+
+    def most_similar(self, name, topn=10):
+        '''
+            Names most similar to the vector named name (excluding itself).
+            Output: pd.Series of cosine similarities indexed by name.
+        '''
+        ind = self.names.get_loc(name)
+        ids, scores = self.query(self.vectors[ind], topn, exclude=[ind,])
+        return self.to_series(ids[0], scores[0], name)
+
+    def most_similar_vector(self, vector, topn=10):
+        '''
+            Names of vectors most similar to an arbitrary vector.
+        '''
+        ids, scores = self.query(vector, topn)
+        return self.to_series(ids[0], scores[0], None)
+
+    def to_series(self, ids, scores, name):
+        keep = ids >= 0
+        return pd.Series(scores[keep], index=self.names[ids[keep]], name=name)
+
+    # ________ Save and Load _________
+    def save(self, path):
+        '''
+            Saves index to folder path as .npy arrays (which can be
+                memory-mapped by VectorIndex.load()), names as a pickle and
+                a meta.json file.
+        '''
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        np.save(os.path.join(path, 'vectors.npy'), self.vectors)
+        if self.mode == 'ivf':
+            for attr in ('centroids','list_indptr','list_ids'):
+                np.save(os.path.join(path, attr+'.npy'), getattr(self, attr))
+        with open(os.path.join(path, 'names.pkl'), 'wb') as f:
+            pickle.dump(list(self.names), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        meta = {'mode':self.mode, 'n_probe':self.n_probe, 'block_size':self.block_size}
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        '''
+            Loads index saved with VectorIndex.save().
+        '''
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        with open(os.path.join(path, 'names.pkl'), 'rb') as f:
+            names = pickle.load(f)
+
+        # vectors are already normalized and clustered, so skip __init__
+        index = cls.__new__(cls)
+        index.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode=mmap_mode)
+        index.names = pd.Index(names)
+        index.mode = meta['mode']
+        index.n_probe = meta['n_probe']
+        index.block_size = meta['block_size']
+        index.centroids, index.list_indptr, index.list_ids = None, None, None
+        if index.mode == 'ivf':
+            for attr in ('centroids','list_indptr','list_ids'):
+                setattr(index, attr, np.load(os.path.join(path, attr+'.npy'), mmap_mode=mmap_mode))
+
+        return index
@@ -0,0 +1,142 @@
+import os.path
+import sqlite3
+import hashlib
+import pickle
+import json
+import zlib
+import spacy
+
+
+class ParseCache:
+    '''
+        Persistent on-disk cache of easytext outputs (the detached
+            doc._.easytext records, see detach_easytext()). Entries
+            are keyed by a hash of the text and the parse configuration
+            (spacy model name/version, easytext and spacy components and
+            pipeargs), so different subcommands and reruns on the same
+            corpus can skip parsing documents that were already parsed.
+        Values are stored as compressed pickles in a sqlite database. When
+            the total size of stored values exceeds max_bytes, least
+            recently used entries are evicted.
+    '''
+    def __init__(self, cache_dir, max_bytes=1024**3, fname='parsecache.sqlite'):
+        '''
+            Inputs:
+                cache_dir: folder where the cache database is stored.
+                    Will be created if it doesn't exist.
+                max_bytes: maximum size of stored (compressed) values.
+                fname: filename of database in cache_dir.
+        '''
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.fname = os.path.join(cache_dir, fname)
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(self.fname)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER, atime INTEGER)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)')
+        self.conn.commit()
+
+        # logical clock for LRU ordering and total stored size
+        clock, size = self.conn.execute('SELECT MAX(atime), SUM(size) FROM entries').fetchone()
+        self.clock = clock if clock is not None else 0
+        self.size = size if size is not None else 0
+
+        # counters for this session
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def __repr__(self):
+        return '<ParseCache {} entries, {:.1f}MB, {} hits, {} misses, {} evictions>'.format(
+            len(self), self.size/1024**2, self.hits, self.misses, self.evictions)
+
+    @staticmethod
+    def make_config(nlp, usepipes, pipeargs, spacy_pipes):
+        '''
+            String describing the parse configuration. Two parses with the
+                same config and text are expected to give the same output.
+        '''
+        config = {
+            'model': '{}_{}'.format(nlp.meta.get('lang'), nlp.meta.get('name')),
+            'model_version': nlp.meta.get('version'),
+            'spacy_version': spacy.__version__,
+            'components': sorted(usepipes),
+            'spacy_components': sorted(spacy_pipes),
+            'pipeargs': {k:v for k,v in pipeargs.items() if k != 'entity_registry'},
+        }
+        return json.dumps(config, sort_keys=True, default=str)
+
+    @staticmethod
+    def make_key(text, config):
+        h = hashlib.sha1(config.encode('utf-8'))
+        h.update(b'\0')
+        h.update(text.encode('utf-8', errors='replace'))
+        return h.hexdigest()
+
+    def get_many(self, keys):
+        '''
+            Returns list of cached values for keys (None when missing),
+                marking found entries as recently used.
+        '''
+        found = dict()
+        for i in range(0, len(keys), 500): # sqlite variable limit
+            sub = keys[i:i+500]
+            q = 'SELECT key, value FROM entries WHERE key IN ({})'.format(','.join('?'*len(sub)))
+            for key, value in self.conn.execute(q, sub):
+                found[key] = pickle.loads(zlib.decompress(value))
+
+        # update access times
+        self.clock += 1
+        self.conn.executemany('UPDATE entries SET atime=? WHERE key=?', [(self.clock,k) for k in found.keys()])
+        self.conn.commit()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return [found.get(k) for k in keys]
+
+    def put_many(self, items):
+        '''
+            Stores (key, value) pairs, then evicts least recently used
+                entries until the cache fits in max_bytes.
+        '''
+        self.clock += 1
+        rows = list()
+        for key, value in items:
+            blob = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+            rows.append((key, blob, len(blob), self.clock))
+
+        for key, blob, size, atime in rows:
+            old = self.conn.execute('SELECT size FROM entries WHERE key=?', (key,)).fetchone()
+            if old is not None:
+                self.size -= old[0]
+            self.size += size
+        self.conn.executemany('INSERT OR REPLACE INTO entries VALUES (?,?,?,?)', rows)
+
+        if self.size > self.max_bytes:
+            self.evict()
+        self.conn.commit()
+
+    def evict(self):
+        '''
+            Removes least recently used entries until size <= max_bytes.
+        '''
+        remove = list()
+        for key, size in self.conn.execute('SELECT key, size FROM entries ORDER BY atime ASC'):
+            if self.size <= self.max_bytes:
+                break
+            remove.append((key,))
+            self.size -= size
+        self.conn.executemany('DELETE FROM entries WHERE key=?', remove)
+        self.evictions += len(remove)
+
+    def clear(self):
+        self.conn.execute('DELETE FROM entries')
+        self.conn.commit()
+        self.size = 0
+
+    def close(self):
+        self.conn.close()
@@ -1,7 +1,12 @@
 
 from spacy.tokens import Doc
+from spacy.attrs import ORTH, LOWER, IS_ALPHA, ENT_TYPE, POS, DEP, HEAD, LENGTH, SPACY
+from spacy.symbols import NOUN, PROPN, VERB, ADP, DET, ADJ, NUM, PRON, PART
 import string
-from collections import Counter
+import sys
+import re
+from collections import Counter, namedtuple, OrderedDict
+import numpy as np
 import spacy
 
     
@@ -12,10 +17,279 @@ import spacy
 def use_token(tok):
     return tok.is_alpha or (tok.text[0] == "'" and tok.text[1:].isalpha())
 
+def use_text(text):
+    # same as use_token() for token text
+    return text.isalpha() or (text[:1] == "'" and text[1:].isalpha())
+
+class TokenFilter():
+    '''
+        Array version of use_token() and the usetext functions in 
+            ExtractWordListPipeline and ExtractSentListPipeline. Token 
+            attributes are read once per document with doc.to_array(), 
+            and the checks and strings needed for non-alpha tokens and 
+            output text are cached by lexeme (orth/lower hash), so only 
+            lexemes not seen in earlier documents are looked at in Python.
+        Inputs:
+            use_ents: keep original case of entity tokens.
+    '''
+    def __init__(self, use_ents=False):
+        self.use_ents = use_ents
+        self.attrs = [ORTH, LOWER, IS_ALPHA, ENT_TYPE] if use_ents else [ORTH, LOWER, IS_ALPHA]
+        self.keep_cache = dict() # orth hash -> use_text() for non-alpha tokens
+        self.strings = dict() # hash -> str
+    
+    def get_string(self, doc, key):
+        if key not in self.strings:
+            self.strings[key] = doc.vocab.strings[key]
+        return self.strings[key]
+    
+    def keys(self, doc, arr=None):
+        '''
+            Output: (keys, keep) where keys is the uint64 hash of the output
+                text of each token and keep is a boolean mask of tokens
+                passing use_token().
+            Inputs:
+                arr: optional output of doc.to_array() whose first columns
+                    are self.attrs (see ExtractFusedPipeline).
+        '''
+        if arr is None:
+            arr = doc.to_array(self.attrs).reshape(len(doc), len(self.attrs))
+        keep = arr[:,2] == 1
+        
+        # only non-alpha lexemes need a string check (i.e. "'s")
+        for i in np.flatnonzero(~keep):
+            orth = int(arr[i,0])
+            if orth not in self.keep_cache:
+                self.keep_cache[orth] = use_text(self.get_string(doc, orth))
+            keep[i] = self.keep_cache[orth]
+        
+        if self.use_ents:
+            keys = np.where(arr[:,3] == 0, arr[:,1], arr[:,0])
+        else:
+            keys = arr[:,1]
+        return keys, keep
+    
+    def words(self, doc, keys, keep):
+        '''
+            List of output text for kept tokens.
+        '''
+        return [self.get_string(doc, k) for k in keys[keep].tolist()]
+    
+    def doctokens(self, doc, keys, keep, sent_starts=None):
+        '''
+            DocTokens for kept tokens, with types in order of first 
+                appearance (same output as intern_tokens()).
+            Inputs:
+                sent_starts: token index where each sentence starts, or None
+                    for word lists.
+        '''
+        kept = keys[keep]
+        uniq, first, inverse = np.unique(kept, return_index=True, return_inverse=True)
+        order = np.argsort(first, kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        
+        types = [self.get_string(doc, k) for k in uniq[order].tolist()]
+        ids = rank[inverse].astype(np.int32)
+        if sent_starts is not None:
+            nkept = np.concatenate([[0,],np.cumsum(keep)])
+            sent_offsets = np.append(nkept[sent_starts], len(ids)).astype(np.int32)
+        else:
+            sent_offsets = None
+        return DocTokens(types, ids, sent_offsets)
+
+# compact token output used when pipeargs['token_ids'] is set: types is the 
+#   list of distinct token strings in the document, ids is an int32 array of 
+#   indices into types, and sent_offsets marks where each sentence starts in 
+#   ids (None for word lists). See TokenCorpus for corpus-level storage.
+DocTokens = namedtuple('DocTokens', ['types', 'ids', 'sent_offsets'])
+
+# output keys of easytext components, stored in EasyTextRecord slots. New
+#   components need to add their output names here.
+RECORD_FIELDS = ('wordlist', 'sentlist', 'entlist', 'entids', 'entinds', 'prepphrases', 'nounverbs', 'entverbs', 'nounphrases')
+
+class EasyTextRecord:
+    '''
+        Per-document container of easytext outputs, accessed like a 
+            dictionary (i.e. rec['wordlist']). Each output has a slot, so
+            records have no per-instance dict and outputs of disabled 
+            components are never allocated. Records pickle as a bitmask of
+            set outputs and a tuple of their values (plus the class path, 
+            which pickle writes once per stream, i.e. per list of records).
+            Outputs only hold strings, numbers and arrays, never spacy 
+            objects, so a record does not keep its Doc alive.
+    '''
+    __slots__ = RECORD_FIELDS
+    
+    @classmethod
+    def from_items(cls, items):
+        rec = cls()
+        for k,v in items:
+            rec[k] = v
+        return rec
+    
+    def __getstate__(self):
+        # bitmask of set fields instead of their names
+        keys = self.keys()
+        mask = sum(1 << RECORD_FIELDS.index(k) for k in keys)
+        return (mask, tuple(getattr(self, k) for k in keys))
+    
+    def __setstate__(self, state):
+        mask, values = state
+        keys = [k for i,k in enumerate(RECORD_FIELDS) if mask & (1 << i)]
+        for k,v in zip(keys, values):
+            setattr(self, k, v)
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+    
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except (AttributeError, TypeError):
+            raise KeyError('{} is not an easytext output (see RECORD_FIELDS).'.format(key))
+    
+    def __delitem__(self, key):
+        try:
+            delattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+    
+    def __contains__(self, key):
+        return key in RECORD_FIELDS and hasattr(self, key)
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self):
+        return len(self.keys())
+    
+    def __eq__(self, other):
+        if not hasattr(other, 'items'):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+    
+    def __repr__(self):
+        return 'EasyTextRecord({})'.format(', '.join('{}=...'.format(k) for k in self.keys()))
+    
+    def keys(self):
+        return [k for k in RECORD_FIELDS if hasattr(self, k)]
+    
+    def values(self):
+        return [getattr(self, k) for k in self.keys()]
+    
+    def items(self):
+        return [(k,getattr(self, k)) for k in self.keys()]
+    
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in RECORD_FIELDS else default
+    
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if len(default) > 0:
+            return default[0]
+        raise KeyError(key)
+    
+    def copy(self):
+        return EasyTextRecord.from_items(self.items())
+    
+    def to_dict(self):
+        return dict(self.items())
+    
+    def nbytes(self):
+        '''
+            Approximate memory used by the record and its outputs in bytes
+                (strings shared between outputs are counted each time).
+        '''
+        return sys.getsizeof(self) + sum(deep_sizeof(v) for v in self.values())
+
+def deep_sizeof(obj):
+    '''
+        Approximate size in bytes of nested lists/tuples of strings, numbers
+            and numpy arrays (i.e. easytext outputs).
+    '''
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is not None else 0)
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(deep_sizeof(o) for o in obj)
+    return sys.getsizeof(obj)
+
+EASYTEXT_KEY = '_easytext_record'
+
+class _RecordSlot(list):
+    '''
+        Holds the EasyTextRecord of a doc in doc.user_data. The slot is an 
+            empty list to msgpack and pickles as an empty slot, so 
+            Doc.to_bytes() and pickled docs never carry the record.
+    '''
+    __slots__ = ('record',)
+    
+    def __init__(self):
+        super().__init__()
+        self.record = EasyTextRecord()
+    
+    def __reduce__(self):
+        return (_RecordSlot, ())
+
+def get_easytext(doc):
+    slot = doc.user_data.get(EASYTEXT_KEY)
+    if not isinstance(slot, _RecordSlot):
+        # new doc, or a doc restored by from_bytes() or unpickling
+        slot = doc.user_data[EASYTEXT_KEY] = _RecordSlot()
+    return slot.record
+
+def set_easytext_extension():
+    '''
+        Registers the doc._.easytext extension, which gives the 
+            EasyTextRecord of each doc. Records are kept in doc.user_data
+            but are not included in Doc.to_bytes() output or pickled docs.
+    '''
+    if not Doc.has_extension('easytext'):
+        Doc.set_extension('easytext', getter=get_easytext)
+
+def intern_tokens(sents, sentlist=True):
+    '''
+        Converts list of token lists into DocTokens.
+    '''
+    local = dict()
+    ids = [local.setdefault(w, len(local)) for s in sents for w in s]
+    if sentlist:
+        sent_offsets = np.cumsum([0,]+[len(s) for s in sents], dtype=np.int32)
+    else:
+        sent_offsets = None
+    return DocTokens(list(local.keys()), np.array(ids, dtype=np.int32), sent_offsets)
+
 def combine_ent_tokens(doc):
-    # got code from internet
-    for ent in doc.ents:
-        ent.merge(tag=ent.root.tag_, ent_type=ent.root.ent_type_)
+    # merges all entity spans in a single retokenization
+    with doc.retokenize() as retokenizer:
+        for ent in doc.ents:
+            retokenizer.merge(ent, attrs={'TAG':ent.root.tag_, 'ENT_TYPE':ent.root.ent_type_})
+
+class MergeEntitiesPipeline():
+    #name = 'easytext-mergeents'
+    '''
+        Merges multi-word entities into single tokens. Added once to the
+            pipeline as a dependency of components that read merged
+            entities (entlist, and wordlist/sentlist with use_ents), so 
+            each doc is only retokenized once.
+        Inputs:
+            nlp: spacy nlp object, usually initalized using 
+                nlp = spacy.load('en')
+            kwargs: dictionary corresponding to settings for this
+                pipeline component. Currently unused.
+    '''
+    def __init__(self, nlp, kwargs):
+        set_easytext_extension()
+    
+    def __call__(self, doc):
+        combine_ent_tokens(doc)
+        return doc
     
 
 class ExtractWordListPipeline():
@@ -30,29 +304,23 @@ class ExtractWordListPipeline():
             kwargs: dictionary corresponding to settings for this
                 pipeline component.
                 kwargs['use_ents']: combine multi-word entities.
+                kwargs['token_ids']: output DocTokens instead of list of str.
     '''
     def __init__(self,nlp, kwargs):
         self.use_ents = kwargs['use_ents']
+        self.token_ids = kwargs['token_ids']
+        self.filter = TokenFilter(self.use_ents)
         
-        if not Doc.has_extension('easytext'):
-            Doc.set_extension('easytext', default=dict())
-        
-        if self.use_ents:
-            self.usetext = lambda t: t.lower_ if t.ent_type_=='' else t.text
-        else:
-            self.usetext = lambda t: t.lower_
-        
-        if not Doc.has_extension('easytext'):
-            Doc.set_extension('easytext', default=dict())
+        set_easytext_extension()
             
             
     def __call__(self, doc):
         
-        # to combine entities
-        if self.use_ents:
-            combine_ent_tokens(doc)
-        
-        wordlist = [self.usetext(t) for t in doc if use_token(t)]
+        keys, keep = self.filter.keys(doc)
+        if self.token_ids:
+            wordlist = self.filter.doctokens(doc, keys, keep)
+        else:
+            wordlist = self.filter.words(doc, keys, keep)
         
         doc._.easytext['wordlist'] = wordlist
         #doc._.easytext['wordcounts'] = dict(Counter(wordlist))
@@ -70,28 +338,29 @@ class ExtractSentListPipeline():
             kwargs: dictionary corresponding to settings for this
                 pipeline component.
                 kwargs['use_ents']: combine multi-word entities.
+                kwargs['token_ids']: output DocTokens instead of list of 
+                    lists of str.
     '''
     #name = 'easytext-wordlist'
     def __init__(self,nlp, kwargs):
         self.use_ents = kwargs['use_ents']
+        self.token_ids = kwargs['token_ids']
+        self.filter = TokenFilter(self.use_ents)
         
-        if not Doc.has_extension('easytext'):
-            Doc.set_extension('easytext', default=dict())
-            
-            
-        if self.use_ents:
-            self.usetext = lambda t: t.lower_ if t.ent_type_=='' else t.text
-        else:
-            self.usetext = lambda t: t.lower_
+        set_easytext_extension()
             
         
     def __call__(self, doc):
         
         
-        if self.use_ents:
-            combine_ent_tokens(doc)
-        
-        sentlist = [[self.usetext(t) for t in s if use_token(t)] for s in doc.sents]
+        keys, keep = self.filter.keys(doc)
+        sent_starts = [s.start for s in doc.sents]
+        if self.token_ids:
+            sentlist = self.filter.doctokens(doc, keys, keep, sent_starts)
+        else:
+            words = self.filter.words(doc, keys, keep)
+            bounds = np.concatenate([[0,],np.cumsum(keep)])[sent_starts+[len(doc),]].tolist()
+            sentlist = [words[b:e] for b,e in zip(bounds[:-1],bounds[1:])]
         
         doc._.easytext['sentlist'] = sentlist
         
@@ -99,12 +368,138 @@ class ExtractSentListPipeline():
 
 # --------------------------------- MOSTLY NER FOCUSED -----------------------------------
     
+# removes punctuation and spaces (built once instead of per entity)
+BASETEXT_TABLE = str.maketrans('','', string.punctuation+' ')
+
 def get_basetext(etext):
     # (i.e. combine "US" with "U.S.")
-    rmpunc_table = etext.maketrans('','', string.punctuation)
-    rmpunct = etext.translate(rmpunc_table)
-    basetext = rmpunct.upper().replace(' ','')
-    return basetext
+    return etext.translate(BASETEXT_TABLE).upper()
+
+class EntityRegistry:
+    '''
+        Assigns integer ids to entities, combining surface forms with the 
+            same base text (see get_basetext()). The canonical name of an 
+            entity is the first surface form registered for it. Documents 
+            only need to store entity ids, which are resolved with name() 
+            or forms().
+        If max_entities is set, the least recently seen entities are evicted
+            when the registry grows past it, except entities seen at least 
+            keep_count times and the entity just added (so the registry can
+            exceed max_entities if all older entities are that frequent). 
+            An evicted entity gets a new id if it is seen again; otherwise 
+            ids never change.
+    '''
+    def __init__(self, max_entities=None, keep_count=None):
+        self.max_entities = max_entities
+        self.keep_count = keep_count
+        
+        self.ids = OrderedDict() # basetext -> id, least recently seen first
+        self.names = dict() # id -> canonical name
+        self.surface = dict() # id -> set(surface forms)
+        self.counts = dict() # id -> number of times seen
+        self.next_id = 0
+        self.evictions = 0
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __contains__(self, etext):
+        return get_basetext(etext) in self.ids
+    
+    def __repr__(self):
+        return '<EntityRegistry {} entities, {} evicted>'.format(len(self), self.evictions)
+    
+    def add(self, etext, count=1):
+        '''
+            Registers a surface form and returns its entity id.
+        '''
+        basetext = get_basetext(etext)
+        eid = self.ids.get(basetext)
+        if eid is None:
+            eid = self.next_id
+            self.next_id += 1
+            self.ids[basetext] = eid
+            self.names[eid] = etext
+            self.surface[eid] = {etext,}
+            self.counts[eid] = count
+            if self.max_entities is not None and len(self.ids) > self.max_entities:
+                self.evict(keep=basetext)
+        else:
+            self.ids.move_to_end(basetext)
+            self.surface[eid].add(etext)
+            self.counts[eid] += count
+        return eid
+    
+    def get_id(self, etext):
+        return self.ids.get(get_basetext(etext))
+    
+    def name(self, eid):
+        return self.names[eid]
+    
+    def forms(self, eid):
+        return self.surface[eid]
+    
+    def evict(self, keep=None):
+        '''
+            Removes least recently seen entities (skipping keep and those 
+                seen at least keep_count times) until there are 
+                max_entities, or every entity has been checked once.
+        '''
+        for i in range(len(self.ids)):
+            if len(self.ids) <= self.max_entities:
+                break
+            basetext, eid = next(iter(self.ids.items()))
+            if basetext == keep or (self.keep_count is not None and self.counts[eid] >= self.keep_count):
+                self.ids.move_to_end(basetext) # frequent and new entities are kept
+                continue
+            del self.ids[basetext]
+            del self.names[eid], self.surface[eid], self.counts[eid]
+            self.evictions += 1
+    
+    def snapshot(self):
+        '''
+            Picklable copy of the registry contents as plain lists, in 
+                least to most recently seen order.
+        '''
+        eids = list(self.ids.values())
+        return {
+            'ids': eids,
+            'names': [self.names[i] for i in eids],
+            'forms': [sorted(self.surface[i]) for i in eids],
+            'counts': [self.counts[i] for i in eids],
+            'next_id': self.next_id,
+            'max_entities': self.max_entities,
+            'keep_count': self.keep_count,
+        }
+    
+    @classmethod
+    def from_snapshot(cls, snap):
+        registry = cls(max_entities=snap['max_entities'], keep_count=snap['keep_count'])
+        for eid, name, forms, count in zip(snap['ids'], snap['names'], snap['forms'], snap['counts']):
+            registry.ids[get_basetext(name)] = eid
+            registry.names[eid] = name
+            registry.surface[eid] = set(forms)
+            registry.counts[eid] = count
+        registry.next_id = snap['next_id']
+        return registry
+    
+    def merge(self, other):
+        '''
+            Adds the entities of another registry (or snapshot) to this one,
+                i.e. from another worker process. Entities already in this
+                registry keep their id and name.
+            Output: dictionary mapping ids of other to ids in this registry.
+        '''
+        if not isinstance(other, EntityRegistry):
+            other = EntityRegistry.from_snapshot(other)
+        
+        remap = dict()
+        for basetext, oid in other.ids.items():
+            eid = self.add(other.names[oid], count=other.counts[oid])
+            for form in other.surface[oid]:
+                self.surface[eid].add(form)
+            remap[oid] = eid
+        return remap
 
 class ExtractEntListPipeline():
     #name = 'easytext-entlist'
@@ -123,26 +518,29 @@ class ExtractEntListPipeline():
                 kwargs['ignore_ent_types']: entity types to exclude
                     in returned entity lists. Mut. exclusive with
                     'use_ent_types'.
+                kwargs['entity_registry']: EntityRegistry used to 
+                    combine entities. If None, entities are not 
+                    registered (easyparse() creates a registry when none
+                    is given, and registers entities of worker processes
+                    in the parent).
+        Outputs 'entlist' as the text of each entity, 'entids' as the 
+            registry id of each entity (resolve names with 
+            registry.name(eid)) and 'entinds' as the index of each (merged)
+            entity token in the doc.
     '''
     def __init__(self, nlp, kwargs):
         
         self.use_ent_types = kwargs['use_ent_types']
         self.ignore_ent_types = kwargs['ignore_ent_types']
-        
-        self.entmap = dict() # basetext -> list(entnames)
+        self.registry = kwargs.get('entity_registry')
         
         # these will be set by spacy in the pipeline
-        if not Doc.has_extension('easytext'):
-            Doc.set_extension('easytext', default=dict())        
+        set_easytext_extension()
 
     
     def __call__(self, doc):
         
-        # merge multi-word entities
-        spans = list(doc.ents)
-        for span in spans:
-            span.merge()
-
+        # multi-word entities were merged by MergeEntitiesPipeline
         # extract entities that meet conditions
         is_ent = lambda e: e.ent_type > 0 and len(e.text.strip()) > 0
         if self.use_ent_types is None and self.ignore_ent_types is None:
@@ -154,52 +552,59 @@ class ExtractEntListPipeline():
         else:
             raise Exception('shoot - logical error here')
         
-        # combine entities if they have same basetext
-        entdat = list()
-        for ent in ents:
-            basetext = get_basetext(ent.text)
-            
-            if basetext not in self.entmap.keys():
-                self.entmap[basetext] = [ent.text,]
-            
-            elif ent.text not in self.entmap[basetext]:
-                self.entmap[basetext].append(ent.text)
-                
-            entdat.append( (self.entmap[basetext][0],ent) )
-            
-        # count entities in this list
-        entcts = dict(Counter([n for n,e in entdat]))
-        
         # set properties into pipeline
-        doc._.easytext['entlist'] = entdat
-        doc._.easytext['entmap'] = self.entmap
-        #doc._.easytext['entcts'] = entcts
+        doc._.easytext['entlist'] = [ent.text for ent in ents]
+        doc._.easytext['entinds'] = [ent.i for ent in ents]
+        
+        # combine entities if they have same basetext
+        if self.registry is not None:
+            doc._.easytext['entids'] = [self.registry.add(ent.text) for ent in ents]
         
         return doc
     
 # ------------------------------- GRAMMAR FOCUSED PIPELINES ------------------------------
 
+def subtree_offsets(doc, inds):
+    '''
+        Character offsets (start, end) of the subtrees of the tokens at 
+            inds, from their left and right edge tokens (spacy stores these,
+            so each lookup is O(1)). The end includes trailing whitespace.
+    '''
+    offsets = list()
+    for i in inds:
+        tok = doc[i]
+        right = tok.right_edge
+        offsets.append((tok.left_edge.idx, right.idx + len(right.text_with_ws)))
+    return offsets
+
 class ExtractPrepositionsPipeline():
     #name = 'easytext-prepositions'
     '''
-        Extracts lists of prepositional phrases from each document.
+        Extracts lists of prepositional phrases from each document. Each
+            phrase is the subtree of a preposition, sliced from the document
+            text between the character offsets of its left and right edge 
+            tokens (so nested phrases are not walked again).
         Inputs:
             nlp: spacy nlp object, usually initalized using 
                 nlp = spacy.load('en')
             kwargs: dictionary corresponding to settings for this
-                pipeline component. Currently unused.
+                pipeline component.
+                kwargs['prep_offsets']: output (start, end) character 
+                    offsets into doc.text instead of phrase strings.
     '''
     def __init__(self,nlp, kwargs):
+        self.prep_offsets = kwargs.get('prep_offsets', False)
         
-        if not Doc.has_extension('easytext'):
-            Doc.set_extension('easytext', default=dict())        
+        set_easytext_extension()
     def __call__(self, doc):
         
-        phrases = list()
-        for tok in doc:
-            if tok.pos_ == 'ADP':
-                pp = ''.join([t.orth_ + t.whitespace_ for t in tok.subtree])
-                phrases.append(pp)
+        offsets = subtree_offsets(doc, np.flatnonzero(doc.to_array(POS) == ADP).tolist())
+        
+        if self.prep_offsets:
+            phrases = offsets
+        else:
+            text = doc.text
+            phrases = [text[start:end] for start,end in offsets]
         
         #doc._.easytext['prepphrasecounts'] = dict(Counter(phrases))
         doc._.easytext['prepphrases'] = phrases
@@ -207,6 +612,104 @@ class ExtractPrepositionsPipeline():
         return doc
     
     
+class ExtractFusedPipeline():
+    #name = 'easytext-fused'
+    '''
+        Computes the outputs of several token-level components (wordlist, 
+            sentlist, prepphrases, nounverbs, entverbs) in one pass. The 
+            token attributes they need are read once with doc.to_array() 
+            and the outputs are computed from the integer arrays instead of 
+            walking spacy Token objects once per component (only the 
+            prepositions themselves are looked up, for their subtree edges). Added by 
+            build_pipeline() in place of those components when more than 
+            one of them is enabled.
+        Inputs:
+            nlp: spacy nlp object, usually initalized using 
+                nlp = spacy.load('en')
+            kwargs: dictionary corresponding to settings for this
+                pipeline component.
+                kwargs['fused_outputs']: names of outputs to compute.
+                kwargs['use_ents']: combine multi-word entities.
+                kwargs['token_ids']: output DocTokens instead of list of str
+                    for wordlist and sentlist.
+                kwargs['prep_offsets']: output prepphrases as (start, end) 
+                    character offsets.
+    '''
+    def __init__(self, nlp, kwargs):
+        self.outputs = set(kwargs['fused_outputs'])
+        self.use_ents = kwargs['use_ents']
+        self.token_ids = kwargs['token_ids']
+        self.prep_offsets = kwargs.get('prep_offsets', False)
+        self.filter = TokenFilter(self.use_ents)
+        self.nsubj = nlp.vocab.strings['nsubj']
+        
+        # only read the attributes the enabled outputs need (filter
+        #   attributes come first, see TokenFilter.keys())
+        attrs = list()
+        if self.outputs & {'wordlist','sentlist'}:
+            attrs += self.filter.attrs
+        if self.outputs & {'nounverbs','entverbs'}:
+            attrs += [ORTH, POS, DEP, HEAD]
+        elif 'prepphrases' in self.outputs:
+            attrs += [POS]
+        self.attrs = list(OrderedDict.fromkeys(attrs))
+        self.cols = {attr:i for i,attr in enumerate(self.attrs)}
+        
+        set_easytext_extension()
+    
+    def __call__(self, doc):
+        
+        arr = doc.to_array(self.attrs).reshape(len(doc), len(self.attrs))
+        
+        if self.outputs & {'wordlist','sentlist'}:
+            keys, keep = self.filter.keys(doc, arr[:,:len(self.filter.attrs)])
+            if not self.token_ids:
+                words = self.filter.words(doc, keys, keep)
+        
+        if 'wordlist' in self.outputs:
+            if self.token_ids:
+                wordlist = self.filter.doctokens(doc, keys, keep)
+            else:
+                wordlist = words
+            doc._.easytext['wordlist'] = wordlist
+        
+        if 'sentlist' in self.outputs:
+            sent_starts = [s.start for s in doc.sents]
+            if self.token_ids:
+                sentlist = self.filter.doctokens(doc, keys, keep, sent_starts)
+            else:
+                bounds = np.concatenate([[0,],np.cumsum(keep)])[sent_starts+[len(doc),]].tolist()
+                sentlist = [words[b:e] for b,e in zip(bounds[:-1],bounds[1:])]
+            doc._.easytext['sentlist'] = sentlist
+        
+        if POS in self.cols:
+            pos = arr[:,self.cols[POS]]
+        
+        if self.outputs & {'nounverbs','entverbs'}:
+            # nouns or entities that are the subject of a verb (see getverb())
+            orth = arr[:,self.cols[ORTH]].tolist()
+            heads = np.arange(len(doc)) + arr[:,self.cols[HEAD]].view(np.int64)
+            is_subj = (arr[:,self.cols[DEP]] == self.nsubj) & (pos[heads] == VERB)
+        
+        if 'nounverbs' in self.outputs:
+            inds = np.flatnonzero(is_subj & ((pos == NOUN) | (pos == PROPN)))
+            doc._.easytext['nounverbs'] = [(self.filter.get_string(doc, orth[i]), self.filter.get_string(doc, orth[heads[i]])) for i in inds.tolist()]
+        
+        if 'entverbs' in self.outputs:
+            inds = [i for i in doc._.easytext['entinds'] if is_subj[i]]
+            doc._.easytext['entverbs'] = [(self.filter.get_string(doc, orth[i]).strip(), self.filter.get_string(doc, orth[heads[i]]).strip()) for i in inds]
+        
+        if 'prepphrases' in self.outputs:
+            # subtree text is sliced from doc.text (see ExtractPrepositionsPipeline)
+            offsets = subtree_offsets(doc, np.flatnonzero(pos == ADP).tolist())
+            if self.prep_offsets:
+                doc._.easytext['prepphrases'] = offsets
+            else:
+                text = doc.text
+                doc._.easytext['prepphrases'] = [text[start:end] for start,end in offsets]
+        
+        return doc
+
 def get_nounverb(noun):
     relations = list()
     verb = getverb(noun)
@@ -230,8 +733,7 @@ class ExtractNounVerbsPipeline():
     def __init__(self,nlp, kwargs):
         #self.phrases = list()
         
-        if not Doc.has_extension('easytext'):
-            Doc.set_extension('easytext', default=dict())        
+        set_easytext_extension()
     def __call__(self, doc):
         
         #for span in list(doc.noun_chunks):
@@ -275,18 +777,13 @@ class ExtractEntVerbsPipeline():
                 component.
     '''
     def __init__(self,nlp, kwargs):
-        if not Doc.has_extension('easytext'):
-            Doc.set_extension('easytext', default=dict())
+        set_easytext_extension()
             
     def __call__(self, doc):
-        # merge multi-word entities
-        spans = list(doc.ents)
-        for span in spans:
-            span.merge()
-        
+        # entity tokens were merged before ExtractEntListPipeline
         entverbs = list()
-        for ename, eobj in doc._.easytext['entlist']:
-            nv = get_nounverb(eobj)
+        for i in doc._.easytext['entinds']:
+            nv = get_nounverb(doc[i])
             if nv is not None:
                 entverbs.append((nv[0].text.strip(), nv[1].text.strip()))
         
@@ -298,6 +795,20 @@ class ExtractEntVerbsPipeline():
     
 
 
+# one character per POS tag, so noun phrases can be found with a regex over 
+#   the tags of a document (see ExtractNounPhrasesPipeline). Other tags are 'x'.
+NP_POS_CODES = {DET:'D', ADJ:'A', NUM:'M', NOUN:'N', PROPN:'P', PRON:'O', PART:'T'}
+NP_PATTERN = re.compile(r'D?[AM]*(?:[NP]+T[AM]*)?[NP]+|O')
+
+def make_pos_table(codes):
+    '''
+        Lookup array from POS symbol id to character code (as uint8).
+    '''
+    table = np.full(max(max(codes.keys())+2, 256), ord('x'), dtype=np.uint8)
+    for pos, code in codes.items():
+        table[pos] = ord(code)
+    return table
+
 class ExtractNounPhrasesPipeline():
     #name = 'easytext-prepositions'
     '''
@@ -308,23 +819,40 @@ class ExtractNounPhrasesPipeline():
             nlp: spacy nlp object, usually initalized using 
                 nlp = spacy.load('en')
             kwargs: dictionary corresponding to settings for this
-                pipeline component. Currently unused.
+                pipeline component.
+                kwargs['parse_nounphrases']: use doc.noun_chunks, which
+                    needs the dependency parser. If False, noun phrases
+                    are found by matching NP_PATTERN against the POS tags
+                    of the document, so only the tagger is needed.
     '''
     def __init__(self,nlp, kwargs):
+        self.parse_nounphrases = kwargs.get('parse_nounphrases', True)
+        self.pos_table = make_pos_table(NP_POS_CODES)
         
-        if not Doc.has_extension('easytext'):
-            Doc.set_extension('easytext', default=dict())
+        set_easytext_extension()
             
     def __call__(self, doc):
         
-        nounphrases = list()
-        for nounphrase in doc.noun_chunks:
-            #np_text = ' '.join(nounphrase)
-            nounphrases.append(nounphrase.text.strip().lower())
+        if self.parse_nounphrases:
+            nounphrases = list()
+            for nounphrase in doc.noun_chunks:
+                #np_text = ' '.join(nounphrase)
+                nounphrases.append(nounphrase.text.strip().lower())
+        else:
+            nounphrases = [doc.text[start:end].strip().lower() for start,end in self.tag_chunks(doc)]
         
         #doc._.easytext['nounphrasecounts'] = dict(Counter(nounphrases))
         doc._.easytext['nounphrases'] = nounphrases
         
         return doc
-
     
+    def tag_chunks(self, doc):
+        '''
+            Character offsets (start, end) of noun phrases found from POS tags.
+        '''
+        arr = doc.to_array([POS, LENGTH, SPACY]).reshape(len(doc), 3)
+        tags = self.pos_table[np.minimum(arr[:,0], len(self.pos_table)-1)] # last code is 'x'
+        
+        ends = np.cumsum(arr[:,1] + arr[:,2]).tolist()
+        starts = [0,] + ends[:-1]
+        return [(starts[m.start()], ends[m.end()-1]) for m in NP_PATTERN.finditer(tags.tobytes().decode('ascii'))]
@@ -1,6 +1,6 @@
 import os
 import pandas as pd
-import itertools
+import numpy as np
 
 def write_report(fname, sheets, hdf_if_fail=True, verbose=True, **kwargs):
     '''
@@ -40,6 +40,16 @@ def write_report(fname, sheets, hdf_if_fail=True, verbose=True, **kwargs):
     
     return final_fname
 
+def to_dense(df):
+    '''
+        Converts dataframes with sparse columns (i.e. from 
+            pd.DataFrame.sparse.from_spmatrix) to dense ones for writing.
+    '''
+    if isinstance(df, pd.DataFrame) and hasattr(df, 'sparse') and len(df.columns) > 0:
+        if all(isinstance(dt, pd.SparseDtype) for dt in df.dtypes):
+            return df.sparse.to_dense()
+    return df
+
 def write_excel(fname,sheets):
     '''
         Write excel file (usually called from write_report).
@@ -50,7 +60,7 @@ def write_excel(fname,sheets):
     
     writer = pd.ExcelWriter(fname)
     for sheetname, sheetdf in sheets:
-        sheetdf.to_excel(writer,sheetname)
+        to_dense(sheetdf).to_excel(writer,sheetname)
     writer.save()
         
                 
@@ -64,48 +74,130 @@ def write_hdf(fname, sheets):
     '''
     
     for sheetname, sheetdf in sheets:
-        sheetdf.to_hdf(fname, sheetname)
+        to_dense(sheetdf).to_hdf(fname, sheetname)
 
         
+def is_sparse_df(df):
+    '''
+        True if all columns of df are sparse (i.e. from 
+            pd.DataFrame.sparse.from_spmatrix).
+    '''
+    return len(df.columns) > 0 and all(isinstance(dt, pd.SparseDtype) for dt in df.dtypes)
+
+def descending(values):
+    '''
+        Negated values for ascending sorts (unsigned and bool types are 
+            converted to float first so they don't wrap around).
+    '''
+    if values.dtype.kind in 'if':
+        return -values
+    return -values.astype(np.float64)
+
+def top_k_indices(values, k=None):
+    '''
+        Column indices of the k largest values in each row of a 2d array, 
+            ordered from largest to smallest (NaN last, ties in column 
+            order). Uses a partition instead of a full sort when k is 
+            smaller than the number of columns.
+    '''
+    neg = descending(values)
+    if neg.dtype.kind == 'f':
+        neg = np.where(np.isnan(neg), np.inf, neg)
+    if k is None or k >= values.shape[1]:
+        return np.argsort(neg, axis=1, kind='stable')
+    
+    # keep values above the kth largest, then the first tied ones
+    thresh = np.partition(neg, k-1, axis=1)[:,k-1:k]
+    above = neg < thresh
+    tied = neg == thresh
+    need = k - above.sum(axis=1, keepdims=True)
+    keep = above | (tied & (np.cumsum(tied, axis=1) <= need))
+    part = np.nonzero(keep)[1].reshape(-1,k)
+    
+    suborder = np.argsort(np.take_along_axis(neg, part, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(part, suborder, axis=1)
+
+def sparse_top_k(matrix, k=None, rowkey=None):
+    '''
+        Sorts the stored entries of a sparse matrix by row and then by 
+            descending value, keeping at most k entries per row.
+        Output: (rows, cols, vals, pos) arrays, where pos is the rank of
+            each entry within its row.
+        Inputs:
+            matrix: scipy sparse matrix.
+            k: max number of entries to keep per row.
+            rowkey: optional array giving the sort position of each row.
+    '''
+    coo = matrix.tocoo()
+    rowkey = coo.row if rowkey is None else np.asarray(rowkey)[coo.row]
+    order = np.lexsort((descending(coo.data), rowkey))
+    rows, cols, vals, keys = coo.row[order], coo.col[order], coo.data[order], rowkey[order]
+    
+    pos = np.arange(len(rows)) - np.searchsorted(keys, keys, side='left')
+    if k is not None:
+        keep = pos < k
+        rows, cols, vals, pos = rows[keep], cols[keep], vals[keep], pos[keep]
+    
+    return rows, cols, vals, pos
+
 def make_summary(df, show_n=30):
     '''
         Makes summary by sorting values in each row
             then listing top dimensions (or counts) in that document.
+            Sparse dataframes only list stored (non-zero) values, so rows
+            with fewer than show_n of them are padded with None.
     '''
     ncols = min(show_n,len(df.columns))
-    sdf = pd.DataFrame(index=df.index,columns=range(ncols))
-    for ind in df.index:
-        vals = df.loc[ind,:].sort_values(ascending=False)
-        sdf.loc[ind,:] = list(vals.index)[:ncols]
+    colnames = np.asarray(df.columns, dtype=object)
+    
+    if is_sparse_df(df):
+        rows, cols, vals, pos = sparse_top_k(df.sparse.to_coo(), ncols)
+        summary = np.full((df.shape[0],ncols), None, dtype=object)
+        summary[rows,pos] = colnames[cols]
+    else:
+        summary = colnames[top_k_indices(np.asarray(df.values), ncols)]
+    
+    sdf = pd.DataFrame(summary, index=df.index, columns=range(ncols))
     return sdf
 
 
-def make_human_report(df):
+def make_human_report(df, topn=None):
     '''
         Creates human readable report from raw values dataframe,
             essentially by folding columns into multi-index then 
-            sorting.
+            sorting. For sparse dataframes, only stored (non-zero)
+            values are listed.
+        Inputs:
+            df: dataframe of values with documents as rows.
+            topn: max number of values to list for each document.
     '''
     
-    indcolname = '__indexcol__' # remporary column for sorting
     valuescolname = 'values'
     totalsindname = '__Totals__'
-    mi = pd.MultiIndex.from_tuples(list(itertools.product(map(str,df.index),df.columns)))
-    hdf = pd.DataFrame(index=mi, columns=[valuescolname,indcolname])
-    for doc,val in hdf.index:
-        hdf.loc[(doc,val,),valuescolname] = df.loc[doc,val]
+    docs = np.array(list(map(str,df.index)), dtype=object)
+    colnames = np.asarray(df.columns, dtype=object)
     
     # sort based on docs then values
-    hdf[indcolname] = list(hdf.index.get_level_values(0))
-    hdf = hdf.sort_values([indcolname,valuescolname],ascending=[True,False])
-    hser = hdf[valuescolname]
+    docorder = np.argsort(docs, kind='stable')
+    if is_sparse_df(df):
+        matrix = df.sparse.to_coo().tocsr()
+        docrank = np.empty_like(docorder)
+        docrank[docorder] = np.arange(len(docorder))
+        rows, cols, vals, pos = sparse_top_k(matrix, topn, rowkey=docrank)
+        mi = pd.MultiIndex.from_arrays([docs[rows], colnames[cols]])
+        hser = pd.Series(vals, index=mi, name=valuescolname)
+        totals = np.asarray(matrix.sum(axis=0)).ravel()
+    else:
+        values = np.asarray(df.values)[docorder]
+        order = top_k_indices(values, topn)
+        mi = pd.MultiIndex.from_arrays([np.repeat(docs[docorder], order.shape[1]), colnames[order].ravel()])
+        hser = pd.Series(np.take_along_axis(values, order, axis=1).ravel(), index=mi, name=valuescolname)
+        totals = df.sum(axis=0).values
     
     # create totals value at bottom
-    totser = df.sum(axis=0).sort_values(ascending=False)
-    mi = pd.MultiIndex.from_tuples([(totalsindname,c) for c in totser.index])
-    totser.index = mi
-    hser = hser.append(totser)
+    totorder = np.argsort(descending(np.asarray(totals)), kind='stable')
+    mi = pd.MultiIndex.from_arrays([np.full(len(totorder), totalsindname, dtype=object), colnames[totorder]])
+    totser = pd.Series(np.asarray(totals)[totorder], index=mi, name=valuescolname)
+    hser = pd.concat([hser, totser])
     
     return hser
-    
-    
\ No newline at end of file
@@ -0,0 +1,113 @@
+'''
+    Long-lived scoring server for DocModels. The model, vectorizer and spacy
+        parser are loaded once, then requests are read as JSON lines from
+        stdin or a unix socket and answered with one JSON line each.
+
+    Request: {"id": <anything>, "texts": [str, ...]} for raw texts, or
+        {"id": <anything>, "tokens": [[str, ...], ...]} for token lists.
+    Response: {"id": <same id>, "features": [[float, ...], ...]}, or
+        {"id": <same id>, "error": str} if the request failed.
+
+    Example: python -m easytext.server mytopicmodel --socket /tmp/easytext.sock
+'''
+
+import sys
+import os
+import json
+import io
+import socketserver
+from argparse import ArgumentParser
+import spacy
+
+from .docmodel import DocModel
+
+def handle_request(model, request, nlp=None, batch_size=1000, **kwargs):
+    '''
+        Computes the response dictionary for a single request dictionary.
+        Inputs:
+            model: DocModel with a stored vectorizer and model.
+            request: dictionary with "texts" or "tokens" key.
+            nlp: spacy nlp object used for raw texts.
+            batch_size: max number of documents transformed at once.
+            kwargs: passed to DocModel.transform_batches().
+    '''
+    response = {'id': request.get('id')}
+    try:
+        if 'texts' in request:
+            docs = request['texts']
+        elif 'tokens' in request:
+            docs = [list(toks) for toks in request['tokens']]
+        else:
+            raise Exception('request should include "texts" or "tokens".')
+
+        features = list()
+        for arr in model.transform_batches(docs, batch_size=batch_size, nlp=nlp, **kwargs):
+            features += arr.tolist()
+        response['features'] = features
+
+    except Exception as e:
+        response['error'] = str(e)
+
+    return response
+
+def serve_jsonl(model, infile, outfile, nlp=None, batch_size=1000, **kwargs):
+    '''
+        Answers JSON-lines requests from infile until it is closed,
+            writing (and flushing) one response line per request line.
+    '''
+    for line in infile:
+        if len(line.strip()) == 0:
+            continue
+
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {'id': None, 'error': 'invalid json: {}'.format(e)}
+        else:
+            response = handle_request(model, request, nlp=nlp, batch_size=batch_size, **kwargs)
+
+        outfile.write(json.dumps(response) + '\n')
+        outfile.flush()
+
+def serve_unix(model, socket_path, nlp=None, batch_size=1000, **kwargs):
+    '''
+        Serves JSON-lines requests on a unix socket. Connections are
+            handled one at a time, each until the client closes it, since
+            the spacy parser and model are shared.
+    '''
+    class JsonLinesHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            infile = io.TextIOWrapper(self.rfile, encoding='utf-8')
+            outfile = io.TextIOWrapper(self.wfile, encoding='utf-8')
+            serve_jsonl(model, infile, outfile, nlp=nlp, batch_size=batch_size, **kwargs)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    server = socketserver.UnixStreamServer(socket_path, JsonLinesHandler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+def make_parser():
+    parser = ArgumentParser(description='Score documents with a saved DocModel (see DocModel.save()).')
+    parser.add_argument('model', help='Folder of model saved with DocModel.save(). Must include the vectorizer and model (i.e. lda or nmf with include_model=True).')
+    parser.add_argument('-s','--socket', type=str, default=None, help='Serve on this unix socket path instead of stdin/stdout.')
+    parser.add_argument('-b','--batch-size', type=int, default=1000, help='Max number of documents transformed at once.')
+    parser.add_argument('-l','--lang', type=str, default='en', help='Spacy model used to parse raw texts.')
+    return parser
+
+if __name__ == '__main__':
+    args = make_parser().parse_args()
+
+    model = DocModel.load(args.model)
+    model.check_model()
+    nlp = spacy.load(args.lang)
+
+    if args.socket is not None:
+        print('serving', args.model, 'on', args.socket, file=sys.stderr)
+        serve_unix(model, args.socket, nlp=nlp, batch_size=args.batch_size)
+    else:
+        serve_jsonl(model, sys.stdin, sys.stdout, nlp=nlp, batch_size=args.batch_size)
@@ -5,20 +5,58 @@ import spacy
 from collections import Counter
 from argparse import ArgumentParser
 import numpy as np
+import os.path
 
-from .algorithms import glove, lda, nmf
+from .algorithms import glove, lda, nmf, online_lda, topic_sweep
 from .reports import write_report, make_human_report, make_summary
 from .easytext import easyparse
+from .pipelines import EntityRegistry
+from .parsecache import ParseCache
+from .tokencorpus import TokenCorpus, DocTermCounter
 
 def common_args(subparser):
-    subparser.add_argument('infiles', nargs='+', help='Input files as either a single text file (must be .txt), multiple text files (specify with glob (i.e. myfolder/*.txt), or a spreadsheet (.csv, .xls, .xlsx) with document name "--doclabel" and text data "--textcol" column names.')
+    subparser.add_argument('infiles', nargs='+', help='Input files as either a single text file (must be .txt), multiple text files (specify with glob (i.e. myfolder/*.txt), or a spreadsheet (.csv, .xls, .xlsx) with document name "--doclabel" and text data "--textcol" column names. Globs may be quoted to avoid shell limits on the number of files. Files are read lazily as documents are parsed.')
     subparser.add_argument('outfile', help='Output spreadsheet. Should end in .xls or .h5 depending on desired format. If command output is too large to be an excel spreadsheet, will save to hdf unless "--nohdfonfail" flag is used.')
 
     subparser.add_argument('-dn','--doclabelcol', type=str, required=False, help='Column name for document title/id.')
     subparser.add_argument('-c','--textcol', type=str, default='text', help='Column name of text data (if excel file provided).')
 
     subparser.add_argument('-nhd','--nohdfonfail', action='store_true', help='Don\'t write hdf if the data is too big for excel.')
-
+    subparser.add_argument('-np','--n-process', type=int, default=1, help='Number of worker processes used to parse texts.')
+    subparser.add_argument('-cd','--cache-dir', type=str, help='Folder for a parse cache that is shared between commands, so documents are only parsed once.')
+    subparser.add_argument('-cs','--cache-size', type=int, default=1024, help='Maximum size of the parse cache in MB.')
+
+def parse_texts(nlp, texts, args, **kwargs):
+    '''
+        Calls easyparse with the parallel/caching options from common_args.
+    '''
+    cache = None
+    if args.cache_dir is not None:
+        cache = ParseCache(args.cache_dir, max_bytes=args.cache_size*1024**2)
+    
+    yield from easyparse(nlp, texts, n_process=args.n_process, cache=cache, **kwargs)
+    
+    if cache is not None:
+        print('parse cache:', cache)
+        cache.close()
+
+
+class ParsedDocs:
+    '''
+        Re-iterable stream of one easyparse output (i.e. 'wordlist') for
+            algorithms that make several passes over the corpus. Texts are 
+            parsed again on each pass unless a parse cache is used.
+    '''
+    def __init__(self, nlp, texts, args, outname, **kwargs):
+        self.nlp = nlp
+        self.texts = texts
+        self.args = args
+        self.outname = outname
+        self.kwargs = kwargs
+    
+    def __iter__(self):
+        for pw in parse_texts(self.nlp, self.texts, self.args, **self.kwargs):
+            yield pw[self.outname]
     
 def subcommand_wordcount_args(main_parser, main_subparsers):
     newp = main_subparsers.add_parser('wordcount', help='Word count across corpus, either by (a) manually selecting words to count or (b) selecting a minimum frequency of words to count.')
@@ -30,37 +68,23 @@ def subcommand_wordcount_args(main_parser, main_subparsers):
 def subcommand_wordcount(texts, docnames, args):
     #print('converting', len(texts), 'texts to bags-of-words')
     nlp = spacy.load('en')
+    counter = DocTermCounter()
+    for pw in parse_texts(nlp,texts,args,enable=['wordlist',],pipeargs={'token_ids':True}):
+        counter.append(pw['wordlist'])
+    
     if args.words is not None:
-        counts = list()
         twords = [w.strip() for w in args.words.split(',')]
         assert(len(twords) > 0)
-        for pw in easyparse(nlp,texts,enable=['wordlist',]):
-            if len(pw['wordlist']) > 0:
-                wc = dict()
-                for tword in twords:
-                    wc[tword] = pw['wordlist'].count(tword)
-                counts.append(wc)
+        counts, twords = counter.count_matrix(usewords=twords)
     else:
         assert(args.min_tf > 0)
         print('Counting all words with min_tf of', args.min_tf)
-
-        docbow = list()
-        for pw in easyparse(nlp,texts,enable=['wordlist',]):
-            if len(pw['wordlist']) > 0:
-                docbow.append(pw['wordlist'])
-        freq = Counter([w for d in docbow for w in d])
-        twords = [w for w,c in freq.items() if c >= args.min_tf]
+        counts, twords = counter.count_matrix(min_tf=args.min_tf)
         print('Kept', len(twords), 'words in vocab to count.')
-        counts = list()
-        for bow in docbow:
-            wc = dict()
-            for tword in twords:
-                wc[tword] = bow.count(tword)
-            counts.append(wc)
 
     # build output sheets
     sheets = list()
-    df = pd.DataFrame(counts,index=docnames)
+    df = pd.DataFrame.sparse.from_spmatrix(counts,index=docnames,columns=twords)
     if args.human_readable:
         hdf = make_human_report(df)
         sheets.append(('humancounts',hdf))
@@ -143,31 +167,23 @@ def subcommand_entities(texts, docnames, args):
         ignorelist = 'DATE,TIME,PERCENT,MONEY,QUANTITY,ORDINAL,CARDINAL'
         pipeargs = {'ignore_ent_types': [t.strip() for t in ignorelist.split(',')]}
 
-    # parse all entities
-    docents = list()
-    for pw in easyparse(nlp,texts,enable=['entlist',],pipeargs=pipeargs):
-        if len(pw['entlist']) > 0:
-            docents.append([n for n,e in pw['entlist']])
+    # count all entities in a single pass (by entity id)
+    registry = EntityRegistry()
+    counter = DocTermCounter()
+    for pw in parse_texts(nlp,texts,args,enable=['entlist',],pipeargs={**pipeargs, 'entity_registry':registry}):
+        counter.append(pw['entids'])
 
     # determine ents to count
-    freq = Counter([e for d in docents for e in d])
-    tents = [w for w,c in freq.items() if c >= args.min_tf]
+    counts, tentids = counter.count_matrix(min_tf=args.min_tf)
+    tents = [registry.name(eid) for eid in tentids]
     if len(tents) == 0:
         raise Exception('No ents reached the count threshold given.')
     print('Kept', len(tents), 'entities to count.')
 
-    # count entities per-doc
-    counts = list()
-    for ents in docents:
-        wc = dict()
-        for tent in tents:
-            wc[tent] = ents.count(tent)
-        counts.append(wc)
-
 
     # build output sheets
     sheets = list()
-    df = pd.DataFrame(counts,index=docnames)
+    df = pd.DataFrame.sparse.from_spmatrix(counts,index=docnames,columns=tents)
     if args.human_readable:
         hdf = make_human_report(df)
         sheets.append(('humanents',hdf))
@@ -188,24 +204,116 @@ def subcommand_entities(texts, docnames, args):
 def subcommand_topicmodel_args(main_parser, main_subparsers):
     newp = main_subparsers.add_parser('topicmodel', help='Run topic modeling algorithms (LDA or NMF).')
     common_args(newp)
-    newp.add_argument('-n', '--numtopics', type=int, required=True, help='Numer of topics.')
+    newp.add_argument('-n', '--numtopics', type=int, help='Numer of topics.')
     newp.add_argument('-t','--type', type=str, default='lda', help="From ('lda','nmf') choose algorithm.")
     newp.add_argument('-s','--seed', type=int, default=0, help='Seed to be used to init topic model.')
     newp.add_argument('-m','--min_tf', type=int, default=0, help='Seed to be used to init topic model.')
     newp.add_argument('-nswm','--nosave_wordmatrix', action='store_true', help='Don\'t save word matrix in excel (helps to make smaller files).')
+    newp.add_argument('-sw','--sweep', type=str, default=None, help='Train models for several numbers of topics instead of --numtopics, as a list "5,10,20" or range "start:stop:step" (stop included). Texts are parsed once and models are trained in --n-process processes.')
+    newp.add_argument('-ss','--seeds', type=str, default=None, help='Comma-separated seeds to train for each number of topics in --sweep mode (default is --seed).')
+    newp.add_argument('-on','--online', action='store_true', help='Train lda on mini-batches of streamed documents so the corpus doesn\'t need to fit in memory. Texts are parsed on each pass, so using --cache-dir is recommended.')
+    newp.add_argument('-bs','--batch-size', type=int, default=1000, help='Number of documents per mini-batch in --online mode.')
+    newp.add_argument('-ne','--n-epochs', type=int, default=1, help='Number of training passes over the corpus in --online mode.')
+    newp.add_argument('-hf','--hash-features', type=int, default=None, help='In --online mode, hash words into this many features instead of building a vocabulary first.')
+    newp.add_argument('-ck','--checkpoint', type=str, default=None, help='In --online mode, file to save the model to during training. Training resumes from this file if it exists.')
+    newp.add_argument('-ce','--checkpoint-every', type=int, default=None, help='Number of mini-batches between checkpoints.')
+
+def parse_int_list(spec):
+    '''
+        Parses "5,10,20" or "start:stop:step" (stop included) into a list
+            of ints.
+    '''
+    if ':' in spec:
+        parts = [int(p) for p in spec.split(':')]
+        start, stop = parts[0], parts[1]
+        step = parts[2] if len(parts) > 2 else 1
+        return list(range(start, stop+1, step))
+    return [int(p) for p in spec.split(',') if len(p.strip()) > 0]
+
+def topicmodel_sweep(nlp, texts, docnames, args):
+    ntopics = parse_int_list(args.sweep)
+    seeds = parse_int_list(args.seeds) if args.seeds is not None else [args.seed,]
+    assert(len(ntopics) > 0 and min(ntopics) > 0)
+    
+    print('converting texts to bags-of-words')
+    bows = TokenCorpus()
+    for pw in parse_texts(nlp,texts,args,enable=['wordlist',],pipeargs={'token_ids':True}):
+        bows.append(pw['wordlist'])
+    assert(max(ntopics) < len(bows))
+    
+    print('training', len(ntopics)*len(seeds), args.type, 'models with', ntopics, 'topics and seeds', seeds)
+    models, metrics = topic_sweep(
+        bows, 
+        ntopics, 
+        seeds=seeds, 
+        kind=args.type, 
+        min_tf=args.min_tf, 
+        n_process=args.n_process, 
+        docnames=docnames,
+    )
+    print(metrics)
+    
+    # one report per model next to the metrics report
+    base, ext = os.path.splitext(args.outfile)
+    for (k,seed), model in models.items():
+        fname = model.write_report(
+            '{}_k{}_s{}{}'.format(base, k, seed, ext), 
+            save_wordmatrix=not args.nosave_wordmatrix, 
+            featurename='topic',
+            hdf_if_fail = not args.nohdfonfail,
+        )
+        print('saved model with', k, 'topics and seed', seed, 'as', fname)
+    
+    final_fname = write_report(
+        args.outfile, 
+        [('sweep', metrics),], 
+        hdf_if_fail=not args.nohdfonfail, 
+        verbose=True,
+    )
+    return final_fname
 
 def subcommand_topicmodel(texts, docnames, args):
-    assert(args.numtopics > 0)
     assert(args.type.lower() in ('lda','nmf'))
-    assert(args.numtopics < len(texts))
     
     nlp = spacy.load('en')
+    
+    if args.sweep is not None:
+        assert(not args.online)
+        return topicmodel_sweep(nlp, texts, docnames, args)
+    
+    assert(args.numtopics is not None and args.numtopics > 0)
+    
+    if args.online:
+        assert(args.type.lower() == 'lda')
+        print('performing online topic modeling with', args.numtopics, 'topics.')
+        bows = ParsedDocs(nlp,texts,args,'wordlist',enable=['wordlist',],pipeargs={'token_ids':True})
+        model = online_lda(
+            bows,
+            n_topics=args.numtopics,
+            docnames=docnames,
+            min_tf=args.min_tf,
+            random_state=args.seed,
+            batch_size=args.batch_size,
+            n_epochs=args.n_epochs,
+            n_features=args.hash_features,
+            checkpoint=args.checkpoint,
+            checkpoint_every=args.checkpoint_every,
+        )
+        
+        print('writing output report')
+        final_fname = model.write_report(
+            args.outfile, 
+            save_wordmatrix=not args.nosave_wordmatrix, 
+            featurename='topic',
+            hdf_if_fail = not args.nohdfonfail,
+        )
+        return final_fname
 
-    print('converting', len(texts), 'texts to bags-of-words')
-    bows = list()
-    for pw in easyparse(nlp,texts,enable=['wordlist',]):
-        if len(pw['wordlist']) > 0:
-            bows.append(pw['wordlist'])
+    print('converting texts to bags-of-words')
+    bows = TokenCorpus()
+    for pw in parse_texts(nlp,texts,args,enable=['wordlist',],pipeargs={'token_ids':True}):
+        bows.append(pw['wordlist'])
+    assert(args.numtopics < len(bows))
 
     print('performing topic modeling with', args.numtopics, 'topics.')
     tmfunc = nmf if args.type.lower() == 'nmf' else lda
@@ -235,6 +343,8 @@ def subcommand_glove_args(main_parser, main_subparsers):
     newp.add_argument('-kw','--keywords', type=str, help='Keywords orient embedding dimensions. Format: "word1,word2|word3", where vector dimension 1 is "word1" + "word2", and dimension 2 is the vector "word3" rejected from dimension 1.')
     newp.add_argument('-m','--min_tf', type=int, default=0, help='Minimum number of word occurrences to include in the model.')
     newp.add_argument('-nswm','--nosave_wordmatrix', action='store_true', help='Don\'t save word matrix in excel (helps to make smaller files).')
+    newp.add_argument('-tw','--top-words', type=int, default=None, help='Only save the top-k words most closely associated with each dimension in the word matrix.')
+    newp.add_argument('-dv','--doc-vectors', type=str, default='fit', choices=['fit','tfidf'], help='Fit paragraph vectors for each document ("fit"), or use the much faster tf-idf weighted mean of word vectors ("tfidf").')
 
 def parse_keywords(kw):
     if kw is None:
@@ -247,17 +357,16 @@ def parse_keywords(kw):
     
 def subcommand_glove(texts, docnames, args):
     assert(args.dimensions > 0)
-    assert(args.dimensions < len(texts))
     keywords = parse_keywords(args.keywords)
     
     nlp = spacy.load('en')
 
     # parse texts using spacy
-    print('converting', len(texts), 'texts to sentence lists')
-    docsents = list()
-    for pw in easyparse(nlp,texts,enable=['sentlist']):
-        if len(pw['sentlist']) > 0:
-            docsents.append(pw['sentlist'])
+    print('converting texts to sentence lists')
+    docsents = TokenCorpus()
+    for pw in parse_texts(nlp,texts,args,enable=['sentlist'],pipeargs={'token_ids':True}):
+        docsents.append(pw['sentlist'])
+    assert(args.dimensions < len(docsents))
 
     print('running glove algorithm with n =', args.dimensions)
     model = glove(
@@ -266,6 +375,9 @@ def subcommand_glove(texts, docnames, args):
         docnames=docnames,
         keywords=keywords,
         min_tf=args.min_tf,
+        dim_topn=args.top_words,
+        doc_vectors=args.doc_vectors,
+        n_process=args.n_process,
     )
 
     print('writing output report to', args.outfile)
@@ -297,6 +409,7 @@ def subcommand_grammar_args(main_parser, main_subparsers):
     np_parser = grammar_subparsers.add_parser('nounphrases', help='Extract noun phrases.',)
     common_args(np_parser)
     add_common_grammar_args(np_parser)
+    np_parser.add_argument('-to','--tagger-only', action='store_true', help='Find noun phrases from POS tags only, skipping the (slower) dependency parser.')
     
     
     # noun - verb pairs
@@ -325,20 +438,17 @@ def subcommand_grammar(texts, docnames, args):
     #args.grammar_command is from {nounphrases, nounverbs, entverbs, prepositions}
     
     # parse texts using spacy
-    print('Extracting grammatical properties from', len(texts), 'texts.')
-    counts = list()
-    for pw in easyparse(nlp,texts,enable=[args.grammar_command,]):
-        cts = dict(Counter(pw[args.grammar_command]))
-        counts.append({str(k).strip():v for k,v in cts.items()})
+    print('Extracting grammatical properties from texts.')
+    counter = DocTermCounter()
+    pipeargs = {'parse_nounphrases':not getattr(args, 'tagger_only', False)}
+    for pw in parse_texts(nlp,texts,args,enable=[args.grammar_command,],pipeargs=pipeargs):
+        counter.append([str(k).strip() for k in pw[args.grammar_command]])
         
             
     # build output sheets
-    df = pd.DataFrame(counts,index=docnames,dtype=np.int32)
-    df[pd.isnull(df)] = 0
-    
-    if args.min_tf > 1:
-        col_satisfies = df.sum(axis=0) > args.min_tf
-        df = df.loc[:,col_satisfies]
+    min_tf = args.min_tf + 1 if args.min_tf > 1 else None
+    counts, phrases = counter.count_matrix(min_tf=min_tf)
+    df = pd.DataFrame.sparse.from_spmatrix(counts.astype(np.int32),index=docnames,columns=phrases)
     
     if df.shape[1] > 0:
         sheet_name = args.grammar_command
@@ -0,0 +1,281 @@
+import numpy as np
+import scipy.sparse
+
+from .pipelines import DocTokens, intern_tokens
+
+
+def map_types(vocab, words, types):
+    '''
+        Returns int32 array of the ids in vocab (word -> id) of each item in 
+            types, adding new words to the end of vocab and words (id -> word).
+    '''
+    remap = np.empty(len(types), dtype=np.int32)
+    for i,w in enumerate(types):
+        wid = vocab.get(w)
+        if wid is None:
+            wid = len(words)
+            vocab[w] = wid
+            words.append(w)
+        remap[i] = wid
+    return remap
+
+def select_columns(matrix, words, min_tf=None, usewords=None):
+    '''
+        Selects columns of a sparse document-term matrix for reporting.
+        Output: (matrix, column names) tuple.
+        Inputs:
+            matrix: sparse <Ndocs x Nvocab> matrix of counts.
+            words: list of column names of matrix.
+            min_tf: keep words that appear at least min_tf times in the 
+                corpus (column sums).
+            usewords: list of words to keep, in that order. Words that 
+                are not in the vocabulary get columns of zeros.
+    '''
+    matrix = scipy.sparse.csr_matrix(matrix)
+    if usewords is not None:
+        vocab = {w:i for i,w in enumerate(words)}
+        
+        # add a column of zeros for missing words
+        zcol = matrix.shape[1]
+        matrix = scipy.sparse.hstack([matrix, scipy.sparse.csr_matrix((matrix.shape[0],1), dtype=matrix.dtype)]).tocsr()
+        cols = [vocab.get(w,zcol) for w in usewords]
+        return matrix[:,cols], list(usewords)
+    
+    elif min_tf is not None:
+        cols = np.flatnonzero(np.asarray(matrix.sum(axis=0)).ravel() >= min_tf)
+        return matrix[:,cols], [words[i] for i in cols]
+    
+    else:
+        return matrix, list(words)
+
+def vocab_count_matrix(docs, vocab, dtype=np.int64):
+    '''
+        Sparse <Ndocs x len(vocab)> matrix of token counts using a fixed 
+            vocabulary. Tokens not in vocab are ignored.
+        Inputs:
+            docs: list of DocTokens or iterables of str.
+            vocab: dictionary of word -> column.
+    '''
+    indices, counts, indptr = list(), list(), [0,]
+    for doc in docs:
+        if not isinstance(doc, DocTokens):
+            doc = intern_tokens([list(doc),], sentlist=False)
+        cols = np.array([vocab.get(w,-1) for w in doc.types], dtype=np.int64)
+        tcounts = np.bincount(doc.ids, minlength=len(doc.types))
+        keep = cols >= 0
+        indices.append(cols[keep])
+        counts.append(tcounts[keep])
+        indptr.append(indptr[-1] + keep.sum())
+    
+    indices = np.concatenate(indices) if len(indices) > 0 else np.zeros(0, dtype=np.int64)
+    counts = np.concatenate(counts) if len(counts) > 0 else np.zeros(0, dtype=dtype)
+    dtm = scipy.sparse.csr_matrix((counts.astype(dtype), indices, np.array(indptr, dtype=np.int64)), shape=(len(indptr)-1, len(vocab)))
+    dtm.sort_indices()
+    return dtm
+
+class DocTermCounter:
+    '''
+        Counts terms in each document in a single pass, storing only the 
+            distinct terms of each document and their counts (CSR layout).
+            Terms can be any hashable objects, and documents can also be 
+            added as DocTokens.
+    '''
+    def __init__(self, docs=None):
+        self.vocab = dict() # term -> id
+        self.words = list() # id -> term
+        
+        self._indices = list()
+        self._counts = list()
+        self._doclens = list()
+        
+        if docs is not None:
+            self.extend(docs)
+    
+    def __len__(self):
+        return len(self._doclens)
+    
+    def append(self, doc):
+        '''
+            Adds the counts of a single document.
+            Inputs:
+                doc: DocTokens or iterable of terms.
+        '''
+        if not isinstance(doc, DocTokens):
+            doc = intern_tokens([list(doc),], sentlist=False)
+        
+        self._indices.append(map_types(self.vocab, self.words, doc.types))
+        self._counts.append(np.bincount(doc.ids, minlength=len(doc.types)))
+        self._doclens.append(len(doc.types))
+    
+    def extend(self, docs):
+        for doc in docs:
+            self.append(doc)
+    
+    def doc_term_matrix(self, dtype=np.int64):
+        '''
+            Creates sparse <Ndocs x Nvocab> matrix of counts.
+        '''
+        indices = np.concatenate(self._indices) if len(self._indices) > 0 else np.zeros(0, dtype=np.int32)
+        counts = np.concatenate(self._counts) if len(self._counts) > 0 else np.zeros(0, dtype=dtype)
+        indptr = np.concatenate([[0,],np.cumsum(self._doclens)]).astype(np.int64)
+        
+        dtm = scipy.sparse.csr_matrix((counts.astype(dtype), indices, indptr), shape=(len(self), len(self.words)))
+        dtm.sort_indices()
+        return dtm
+    
+    def count_matrix(self, min_tf=None, usewords=None):
+        '''
+            Document-term counts ready for reporting.
+            Output: (sparse matrix, column names) tuple.
+            Inputs:
+                min_tf: keep terms that appear at least min_tf times.
+                usewords: list of terms to count, in that order.
+        '''
+        return select_columns(self.doc_term_matrix(), self.words, min_tf=min_tf, usewords=usewords)
+
+class TokenCorpus:
+    '''
+        Stores the tokens of a whole corpus as integer ids into a shared
+            vocabulary, in a CSR-style layout: ids holds the token ids of all
+            documents end to end, doc_indptr[i]:doc_indptr[i+1] is the slice
+            of ids belonging to document i, and sent_indptr does the same
+            for sentences. This uses a few bytes per token instead of a python
+            string per token, and can be passed directly to lda(), nmf() and
+            glove().
+        Documents are added using the DocTokens output of the wordlist or
+            sentlist components when easyparse is called with
+            pipeargs={'token_ids':True}.
+    '''
+    def __init__(self, docs=None):
+        '''
+            Inputs:
+                docs: optional iterable of DocTokens or lists of str to add.
+        '''
+        self.vocab = dict() # word -> id
+        self.words = list() # id -> word
+
+        # growing buffers, concatenated when the arrays are accessed
+        self._ids = list()
+        self._doclens = list()
+        self._sentlens = list()
+        self._docsents = list()
+        self._arrays = None
+
+        if docs is not None:
+            self.extend(docs)
+
+    def __len__(self):
+        return len(self._doclens)
+
+    def __repr__(self):
+        return '<TokenCorpus {} docs, {} tokens, {} types>'.format(len(self), self.doc_indptr[-1], len(self.words))
+
+    def append(self, doc):
+        '''
+            Adds a single document.
+            Inputs:
+                doc: DocTokens (output of wordlist or sentlist with
+                    pipeargs['token_ids']) or list of str.
+        '''
+        if not isinstance(doc, DocTokens):
+            doc = intern_tokens([doc,], sentlist=False)
+
+        # map document-local type ids to corpus ids
+        remap = map_types(self.vocab, self.words, doc.types)
+
+        self._ids.append(remap[doc.ids])
+        self._doclens.append(len(doc.ids))
+        if doc.sent_offsets is None:
+            sentlens = [len(doc.ids),]
+        else:
+            sentlens = np.diff(doc.sent_offsets)
+        self._sentlens.extend(sentlens)
+        self._docsents.append(len(sentlens))
+        self._arrays = None
+
+    def extend(self, docs):
+        for doc in docs:
+            self.append(doc)
+
+    def _get_arrays(self):
+        if self._arrays is None:
+            ids = np.concatenate(self._ids) if len(self._ids) > 0 else np.zeros(0, dtype=np.int32)
+            self._ids = [ids,]
+            self._arrays = dict(
+                ids = ids,
+                doc_indptr = np.concatenate([[0,],np.cumsum(self._doclens)]).astype(np.int64),
+                sent_indptr = np.concatenate([[0,],np.cumsum(self._sentlens)]).astype(np.int64),
+                doc_sent_indptr = np.concatenate([[0,],np.cumsum(self._docsents)]).astype(np.int64),
+            )
+        return self._arrays
+
+    @property
+    def ids(self):
+        return self._get_arrays()['ids']
+
+    @property
+    def doc_indptr(self):
+        return self._get_arrays()['doc_indptr']
+
+    @property
+    def sent_indptr(self):
+        return self._get_arrays()['sent_indptr']
+
+    @property
+    def doc_sent_indptr(self):
+        return self._get_arrays()['doc_sent_indptr']
+
+    # ________ Access Documents _________
+    def doc_ids(self, i):
+        return self.ids[self.doc_indptr[i]:self.doc_indptr[i+1]]
+
+    def doc_words(self, i):
+        return [self.words[wid] for wid in self.doc_ids(i)]
+
+    def iter_docs(self):
+        for i in range(len(self)):
+            yield self.doc_ids(i)
+
+    def iter_sents(self):
+        ids, indptr = self.ids, self.sent_indptr
+        for i in range(len(indptr)-1):
+            yield ids[indptr[i]:indptr[i+1]]
+
+    # ________ Counting _________
+    def term_frequencies(self):
+        '''
+            Number of occurrences of each vocab word in the corpus.
+        '''
+        return np.bincount(self.ids, minlength=len(self.words))
+
+    def doc_term_matrix(self, min_df=None, sort_vocab=False, dtype=np.int64):
+        '''
+            Creates sparse <Ndocs x Nvocab> matrix of token counts.
+            Output: (matrix, vocab) tuple.
+            Inputs:
+                min_df: only keep words that appear in at least min_df
+                    documents (as in sklearn CountVectorizer).
+                sort_vocab: order columns alphabetically (as in sklearn
+                    CountVectorizer).
+        '''
+        ids, indptr = self.ids, self.doc_indptr
+        dtm = scipy.sparse.csr_matrix(
+            (np.ones(len(ids), dtype=dtype), ids, indptr),
+            shape=(len(self), len(self.words)),
+            copy=True, # sum_duplicates() sorts indices in place
+        )
+        dtm.sum_duplicates()
+
+        cols = np.arange(len(self.words))
+        if min_df is not None:
+            docfreq = np.bincount(dtm.indices, minlength=len(self.words))
+            cols = cols[docfreq >= min_df]
+        if sort_vocab:
+            cols = np.array(sorted(cols, key=self.words.__getitem__), dtype=cols.dtype)
+
+        if len(cols) < len(self.words) or sort_vocab:
+            dtm = dtm[:,cols]
+        vocab = [self.words[i] for i in cols]
+
+        return dtm, vocab
+
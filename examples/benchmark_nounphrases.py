@@ -0,0 +1,65 @@
+'''
+Compares throughput and agreement of the parser-based (doc.noun_chunks) and 
+tagger-only noun phrase modes of the nounphrases component on the texts in 
+sampletexts/. Paragraphs are treated as documents and repeated to get a 
+measurable runtime.
+
+usage: python examples/benchmark_nounphrases.py [n_repeat]
+'''
+
+import sys
+import os
+import glob
+import time
+from collections import Counter
+import spacy
+
+from easytext import easyparse
+
+def get_sampletexts(folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sampletexts')):
+    texts = list()
+    for fname in sorted(glob.glob(os.path.join(folder, '*.txt'))):
+        with open(fname, 'r') as f:
+            texts += [p.strip() for p in f.read().split('\n\n') if len(p.strip()) > 0]
+    return texts
+
+def run_mode(nlp, texts, parse_nounphrases):
+    start = time.time()
+    phrases = [dat['nounphrases'] for dat in easyparse(nlp, texts, enable=['nounphrases',], pipeargs={'parse_nounphrases':parse_nounphrases})]
+    return phrases, time.time() - start
+
+def agreement(ref_phrases, test_phrases):
+    '''
+        Precision, recall and F1 of test phrases against reference phrases,
+            counting phrases within each document.
+    '''
+    match, nref, ntest = 0, 0, 0
+    for ref, test in zip(ref_phrases, test_phrases):
+        ref, test = Counter(ref), Counter(test)
+        match += sum((ref & test).values())
+        nref += sum(ref.values())
+        ntest += sum(test.values())
+    precision = match/ntest if ntest > 0 else 0
+    recall = match/nref if nref > 0 else 0
+    f1 = 2*precision*recall/(precision+recall) if precision+recall > 0 else 0
+    return precision, recall, f1
+
+if __name__ == '__main__':
+    n_repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    
+    texts = get_sampletexts()*n_repeat
+    nlp = spacy.load('en')
+    print('benchmarking on {} documents'.format(len(texts)))
+    
+    parsed, parsed_time = run_mode(nlp, texts, True)
+    tagged, tagged_time = run_mode(nlp, texts, False)
+    
+    print('parser (noun_chunks): {:.1f} docs/sec'.format(len(texts)/parsed_time))
+    print('tagger only:          {:.1f} docs/sec'.format(len(texts)/tagged_time))
+    print('speedup:              {:.2f}x'.format(parsed_time/tagged_time))
+    print('agreement with noun_chunks: precision={:.3f} recall={:.3f} f1={:.3f}'.format(*agreement(parsed, tagged)))
+    
+    print('\nexample phrases:')
+    for p, t in list(zip(parsed, tagged))[:3]:
+        print('  parser:', p)
+        print('  tagger:', t)
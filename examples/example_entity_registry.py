@@ -0,0 +1,55 @@
+'''
+Checks EntityRegistry behaviour (ids, bounded eviction, snapshot/merge). 
+Does not need a spacy model.
+
+usage: python example_entity_registry.py
+'''
+
+import pickle
+from easytext import EntityRegistry
+
+def check_canonical_names():
+    registry = EntityRegistry()
+    assert registry.add('U.S.') == registry.add('US')
+    assert registry.name(registry.get_id('US')) == 'U.S.'
+    assert registry.forms(registry.get_id('US')) == {'U.S.', 'US'}
+
+def check_lru_eviction():
+    registry = EntityRegistry(max_entities=2)
+    a, b = registry.add('Apple'), registry.add('Bob')
+    registry.add('Apple') # Bob is now least recently seen
+    c = registry.add('Carol')
+    assert 'Bob' not in registry and 'Apple' in registry and 'Carol' in registry
+    assert registry.add('Bob') not in (a, b, c) # evicted entities get new ids
+
+def check_frequent_entities_kept():
+    # every older entity is at keep_count, so the new one must not be evicted
+    registry = EntityRegistry(max_entities=2, keep_count=2)
+    for name in ('Apple', 'Apple', 'Bob', 'Bob'):
+        registry.add(name)
+    eid = registry.add('Carol')
+    assert registry.name(eid) == 'Carol'
+    assert len(registry) == 3 and registry.evictions == 0
+    
+    # once Carol is the only infrequent entity, it is evicted next
+    eid = registry.add('Dave')
+    assert registry.name(eid) == 'Dave' and 'Carol' not in registry
+
+def check_snapshot_merge():
+    worker = EntityRegistry()
+    worker.add('Mexico'); worker.add('Canada'); worker.add('CANADA')
+    snap = pickle.loads(pickle.dumps(worker.snapshot()))
+    
+    main = EntityRegistry()
+    main.add('canada')
+    remap = main.merge(snap)
+    assert remap == {0:1, 1:0}
+    assert main.name(0) == 'canada' and main.forms(0) == {'canada', 'Canada', 'CANADA'}
+    assert main.counts[0] == 3
+
+if __name__ == '__main__':
+    check_canonical_names()
+    check_lru_eviction()
+    check_frequent_entities_kept()
+    check_snapshot_merge()
+    print('EntityRegistry checks passed.')